@@ -3,28 +3,50 @@
 from otree.api import *
 import time
 import random
+import threading
+import json
+import os
 from operator import itemgetter
 from os import environ
+from cda.deadlines import persistent_timeout, set_deadlines
+from cda.downsample import SortedSeries, lttb, merge_series
+from cda import rules, wire
+from cda.inequality import gini, inequality_batch, MEASURES
+from cda.metrics import Metrics
+from cda.operations import BATCH_OPERATIONS, batch_error, misspecified
+from cda.rules import MARKET
+from cda.orderbook import OrderBook, better_offer_available, limit_crosses, match_order, sweep_fills
+from cda.waitingroom import WaitingRoom
 
 doc = """Continuous double auction market"""
 
 class C(BaseConstants):
     NAME_IN_URL = 'sCDA'
+    # The market parameters (group size, rounds, endowments, supply shock, goods) are defined in cda/rules.py,
+    # where the simulation reads them as well
   
-    PLAYERS_PER_GROUP = 6  # Production group size
-    num_trial_rounds = 1
-    NUM_ROUNDS = 7  ## incl. trial periods
+    PLAYERS_PER_GROUP = MARKET['PLAYERS_PER_GROUP']  # Production group size
+    num_trial_rounds = MARKET['num_trial_rounds']
+    NUM_ROUNDS = MARKET['NUM_ROUNDS']  ## incl. trial periods
     base_payment = cu(3.75)  # Base payment for all participants who complete survey
     bonus_payment = cu(1.90)  # Additional payment for highest score increase winner
     FV_MIN = 30
     FV_MAX = 85
-    num_assets_MIN = 10
-    num_assets_MAX = 10
-    cash_MIN_heterogeneous = 5
-    cash_homogeneous = 25  # Fixed cash endowment for homogeneous groups
-    decimals = 2
+    num_assets_MIN = MARKET['num_assets_MIN']
+    num_assets_MAX = MARKET['num_assets_MAX']
+    cash_MIN_heterogeneous = MARKET['cash_MIN_heterogeneous']
+    cash_homogeneous = MARKET['cash_homogeneous']  # Fixed cash endowment for homogeneous groups
+    decimals = MARKET['decimals']
     marketTime = 80  # needed to initialize variables but exchanged by session_config
-    supply_shock_intensity = 1  # 0.8 = 20% reduction, 1.0 = no shock, 0.5 = 50% reduction
+    supply_shock_intensity = MARKET['supply_shock_intensity']  # 0.8 = 20% reduction, 1.0 = no shock, 0.5 = 50% reduction
+    trades_page_size = 50  # number of own trades sent to a participant with a full update (None sends all)
+    bid_asks_buffer_size = 200  # BidAsks observations kept in memory per group before they are written in bulk
+    batch_max_operations = 20  # operations per batch message, see batch()
+    coalesce_window = 0.1  # seconds within which the updates of participants who did not act are merged (0 sends each at once)
+    chart_max_points = 500  # points per series in the trade chart of the market page (None sends all)
+    admin_chart_max_points = 1000  # points per series in the chart of the admin report (None shows all)
+    results_time = 45  # seconds on the Results page, counted from the end of the ResultsWaitPage
+    group_formation_timeout = 1500  # seconds a participant waits for a group (from their own arrival) before EarlyEnd
     
     # Carbon credit destruction constants
     CO2_PER_CREDIT = 1.0  # kg CO2 per carbon credit
@@ -33,18 +55,18 @@ class C(BaseConstants):
     # Good definitions
     # Good A (oatmilk): money price 3, carbon price 1
     # Good B (cowmilk): money price 2, carbon price 3
-    GOOD_A_MONEY_PRICE = 3
-    GOOD_A_CARBON_PRICE = 1
-    GOOD_B_MONEY_PRICE = 2
-    GOOD_B_CARBON_PRICE = 3
+    GOOD_A_MONEY_PRICE = MARKET['GOOD_A_MONEY_PRICE']
+    GOOD_A_CARBON_PRICE = MARKET['GOOD_A_CARBON_PRICE']
+    GOOD_B_MONEY_PRICE = MARKET['GOOD_B_MONEY_PRICE']
+    GOOD_B_CARBON_PRICE = MARKET['GOOD_B_CARBON_PRICE']
     
     # Satisfaction points (constant marginal utility)
     # Conventional preference: prefers cowmilk (Good B) - higher carbon, lower price
-    SATISFACTION_CONVENTIONAL_GOOD_A = 6   # oatmilk satisfaction for conventional
-    SATISFACTION_CONVENTIONAL_GOOD_B = 12  # cowmilk satisfaction for conventional
+    SATISFACTION_CONVENTIONAL_GOOD_A = MARKET['SATISFACTION_CONVENTIONAL_GOOD_A']   # oatmilk satisfaction for conventional
+    SATISFACTION_CONVENTIONAL_GOOD_B = MARKET['SATISFACTION_CONVENTIONAL_GOOD_B']  # cowmilk satisfaction for conventional
     # Eco preference: prefers oatmilk (Good A) - lower carbon, higher price
-    SATISFACTION_ECO_GOOD_A = 12  # oatmilk satisfaction for eco
-    SATISFACTION_ECO_GOOD_B = 6   # cowmilk satisfaction for eco
+    SATISFACTION_ECO_GOOD_A = MARKET['SATISFACTION_ECO_GOOD_A']  # oatmilk satisfaction for eco
+    SATISFACTION_ECO_GOOD_B = MARKET['SATISFACTION_ECO_GOOD_B']   # cowmilk satisfaction for eco
     
     # Treatment definitions
     TREATMENTS = [
@@ -68,30 +90,53 @@ class C(BaseConstants):
 
 
 class Subsession(BaseSubsession):
-    offerID = models.IntegerField(initial=0)
-    orderID = models.IntegerField(initial=0)
-    transactionID = models.IntegerField(initial=0)
+    groupedLikeRound1 = models.BooleanField(initial=False)  # True once the groups of round 1 were copied to this round
 
     def creating_session(self):
         # Groups will be created in TreatmentAssignment WaitPage when all players arrive
         pass
+
+
+# Timing spans, database queries and payload sizes of the market page, see cda/metrics.py.
+# They are off by default, as measuring the payload sizes serialises every update once more. Set CDA_METRICS=1 to collect
+# them, e.g. during a load test, and CDA_METRICS_DUMP to a directory to save them as JSON at the end of each session.
+metrics = Metrics(enabled=environ.get('CDA_METRICS', '0') != '0')
+try:
+    from otree.database import engine as db_engine
+    from sqlalchemy import event
+    event.listen(db_engine, 'before_cursor_execute', metrics.count_query)
+except (ImportError, AttributeError):  # query counts are left at 0 if oTree's database engine is not available
+    pass
+
+
+def metric_label(key):
+    # this function returns the operation name used in the metrics of a message. Other names sent by a client share
+    # the label 'other', such that clients cannot add histograms.
+    if key in ('market_start', 'flush', 'batch') or key in BATCH_OPERATIONS:
+        return key
+    return 'other'
+
+
+def dump_metrics(session):
+    # this code is run at the results wait page of the last round.
+    # this function saves the metrics collected so far as JSON if CDA_METRICS_DUMP names a directory.
+    directory = environ.get('CDA_METRICS_DUMP')
+    if directory and metrics.enabled:
+        os.makedirs(directory, exist_ok=True)
+        metrics.dump(os.path.join(directory, f'metrics_{session.code}.json'))
+
+
 def vars_for_admin_report(subsession):
     # this function defines the values sent to the admin report page
     groups = subsession.get_groups()
-    period = subsession.round_number
     payoffs = sorted([p.payoff for p in subsession.get_players()])
     market_times = sorted([g.marketTime for g in groups])
-    highcharts_series = []
-    trades = [{'x': tx.transactionTime, 'y': tx.price, 'name': 'Trades'} for tx in Transaction.filter() if tx.Period == period and tx.group in groups]
-    highcharts_series.append({'name': 'Trades', 'data': trades, 'type': 'scatter', 'id': 'trades', 'marker': {'symbol': 'circle'}})
-    bids = [{'x': bx.BATime, 'y': bx.bestBid, 'name': 'Bids'} for bx in BidAsks.filter() if bx.Period == period and bx.BATime and bx.bestBid]
-    highcharts_series.append({'name': 'Bids', 'data': bids, 'type': 'line', 'id': 'bids', 'lineWidth': 2})
-    asks = [{'x': ax.BATime, 'y': ax.bestAsk, 'name': 'Asks'} for ax in BidAsks.filter() if ax.Period == period and ax.BATime and ax.bestAsk]
-    highcharts_series.append({'name': 'Asks', 'data': asks, 'type': 'line', 'id': 'bids', 'lineWidth': 2})
+    highcharts_series = admin_report_series(groups)
     return dict(
         marketTimes=market_times,
         payoffs=payoffs,
         series=highcharts_series,
+        metrics=metrics.rows(),
     )
 
 
@@ -107,8 +152,12 @@ class Group(BaseGroup):
     endowment_type = models.StringField(initial="")  # 'homogeneous', 'heterogeneous'
     gini_coefficient = models.FloatField(initial=0, decimal=4)  # Gini coefficient for cash inequality (only for heterogeneous groups)
     group_size = models.IntegerField(initial=0)  # Final group size after regrouping (for data analysis)
+    carriedForward = models.BooleanField(initial=False)  # True once carry_forward() initialised the group in rounds > 1
     bestAsk = models.FloatField()
     bestBid = models.FloatField()
+    offerID = models.IntegerField(initial=0)  # last offerID allocated in this group
+    orderID = models.IntegerField(initial=0)  # last orderID allocated in this group
+    transactionID = models.IntegerField(initial=0)  # last transactionID allocated in this group
     transactions = models.IntegerField(initial=0, min=0)
     marketBuyOrders = models.IntegerField(initial=0, min=0)
     marketSellOrders = models.IntegerField(initial=0, min=0)
@@ -123,6 +172,16 @@ class Group(BaseGroup):
     limitSellVolume = models.IntegerField(initial=0, min=0)
     cancellations = models.IntegerField(initial=0, min=0)
     cancelledVolume = models.IntegerField(initial=0, min=0)
+    scoreMatrix = models.LongStringField(initial='')  # JSON {id_in_group: [Score Change % per trading round]}, see update_score_matrix()
+
+
+def next_id(group: Group, counter: str):
+    # this code is run at the market page, within the order functions.
+    # this function allocates the next offerID, orderID or transactionID. IDs are unique within a group and round,
+    # and each group only touches its own counters, so groups trading at the same time never compete for an ID.
+    value = getattr(group, counter) + 1
+    setattr(group, counter, value)
+    return value
 
 
 def random_types(group: Group):
@@ -161,9 +220,10 @@ def assign_types(group: Group):
             p.roleID = p.participant.vars['roleID']
 
 
-def count_participants(group: Group):
+def count_participants(group: Group, previous_players=None):
     # this code is run at the first WaitToStart page, within the initiate_group() function, when all participants arrived
     # this function determines the number of actual participants.
+    # previous_players optionally maps participant ids to the players of the previous round (see carry_forward).
     if group.round_number == 1:
         # Reset numParticipants before counting (it might have been set earlier)
         group.numParticipants = 0
@@ -176,17 +236,17 @@ def count_participants(group: Group):
             raise
     else:  # since player.isParticipating is not newly assign with a value by a click or a timeout, I take the value from the previous round
         for p in group.get_players():
-            pr = p.in_round(group.round_number - 1)
+            pr = previous_players[p.participant.id] if previous_players else p.in_round(group.round_number - 1)
             p.isParticipating = pr.isParticipating
         group.numParticipants = group.session.vars['numParticipants']
     group.session.vars['numParticipants'] = group.numParticipants
 
 
-def initiate_group(group: Group):
+def initiate_group(group: Group, previous_players=None):
     # this code is run at the first WaitToStart page when all participants arrived
     # this function starts substantial calculations on group level.
     try:
-        count_participants(group=group)
+        count_participants(group=group, previous_players=previous_players)
         assign_types(group=group)
     except Exception as e:
         import traceback
@@ -200,26 +260,197 @@ def get_max_time(group: Group):
     return group.session.config['market_time']  # currently the binary value is retrieved from the config variables
 
 
-def persistent_timeout(player: 'Player', page_name: str, default_seconds: float) -> float:
-    """
-    Create a server-side deadline the first time the player reaches a page in a given round.
-    Subsequent visits (via browser back button, refresh, etc.) use the same deadline so the
-    remaining time can only decrease.
-    """
-    key = f'timeout_deadline_{page_name}_round_{player.round_number}'
-    deadlines = player.participant.vars.setdefault('page_deadlines', {})
-    now = time.time()
-    deadline = deadlines.get(key)
+# Order books of the running markets, keyed by group id. They are kept in memory for the life of a Market round
+# and updated incrementally on limit orders, cancellations and transactions; the Limit table remains the durable record.
+_order_books = {}
 
-    if deadline is None:
-        deadline = now + default_seconds
-        deadlines[key] = deadline
 
-    remaining = deadline - now
+def order_book(group: Group):
+    # this code is run at the market page, within the live_method() and the order functions.
+    # this function returns the group's resident order book and restores it from the Limit table if this process has none yet (e.g., after a restart).
+    book = _order_books.get(group.id)
+    if book is None:
+        offers = [(offer.offerID, offer.price, offer.remainingVolume, offer.makerID, offer.isBid)
+                  for offer in Limit.filter(group=group) if offer.isActive]
+        book = OrderBook.from_offers(offers, track_changes=True)
+        _order_books[group.id] = book
+    return book
 
-    if remaining < 0:
-        return 0
-    return remaining
+
+# Changes collected while a live message is processed (trades and messages) and, per participant, the protocol,
+# sequence number and holdings last sent, keyed by group id.
+_live_updates = {}
+
+
+def live_updates(group: Group):
+    # this code is run at the market page, within the live_method() and the order functions.
+    # this function returns the group's collection of changes for the delta protocol.
+    updates = _live_updates.get(group.id)
+    if updates is None:
+        updates = _live_updates[group.id] = dict(trades=[], news=[], players={})
+    return updates
+
+
+# Trade history of the running markets, keyed by group id: all trades of the group in chronological order (for the chart)
+# and, per participant, the trades they took part in. Rows have the layout [price, transactionVolume, transactionTime, sellerID].
+_trade_histories = {}
+
+
+def trade_history(group: Group):
+    # this code is run at the market page, within the live_method() and the transaction() function.
+    # this function returns the group's trade history and restores it from the Transaction table if this process has none yet.
+    history = _trade_histories.get(group.id)
+    if history is None:
+        history = dict(all=[], players={})
+        for t in Transaction.filter(group=group):
+            add_trade(history, [t.price, t.transactionVolume, t.transactionTime, t.sellerID], t.makerID, t.takerID)
+        _trade_histories[group.id] = history
+    return history
+
+
+def add_trade(history, row, maker_id, taker_id):
+    # this function appends a trade to the group's history and to the histories of both counterparties.
+    history['all'].append(row)
+    history['players'].setdefault(maker_id, []).append(row)
+    history['players'].setdefault(taker_id, []).append(row)
+
+
+def recent_trades(group: Group, player_id):
+    # this function returns a participant's latest trades, newest first and at most C.trades_page_size of them.
+    trades = trade_history(group)['players'].get(player_id, [])
+    if C.trades_page_size:
+        trades = trades[-C.trades_page_size:]
+    return trades[::-1]
+
+
+def record_trade(group: Group, row, maker_id, taker_id):
+    # this code is run at the market page, within the transaction() function.
+    # this function adds a new trade to the trade history and queues it for the next update.
+    add_trade(trade_history(group), row, maker_id, taker_id)
+    live_updates(group)['trades'].append(dict(row=row, maker=maker_id, taker=taker_id))
+    if group.id in _admin_series:
+        _admin_series[group.id]['trades'].add(row[2], row[0])
+
+
+def discard_market_state(group: Group):
+    # this code is run at the wait pages around the market page.
+    # this function releases the group's in-memory order book, trade history, live update state and admin report points.
+    _order_books.pop(group.id, None)
+    _trade_histories.pop(group.id, None)
+    _live_updates.pop(group.id, None)
+    _admin_series.pop(group.id, None)
+    for key in [key for key in _admin_reports if group.id in key]:
+        del _admin_reports[key]
+
+
+# BidAsks observations waiting to be written, keyed by group id. They are written in bulk when a group's buffer
+# reaches C.bid_asks_buffer_size and when the market closes, see flush_bid_asks(). Observations still buffered when the
+# server restarts are lost.
+_bid_asks_buffers = {}
+
+
+def record_bid_asks(group: Group, operation_type: str, best_bid_before, best_ask_before, best_bid, best_ask):
+    # this code is run at the market page, within the live_method(), after each request.
+    # this function buffers the best bid and ask before and after the request, unless the request did not change them.
+    if best_bid_before == best_bid and best_ask_before == best_ask:
+        return
+    buffer = _bid_asks_buffers.setdefault(group.id, [])
+    now = time.time()
+    ba_time = round(float(now - group.marketStartTime), C.decimals)
+    for timing, bid, ask in (('before', best_bid_before, best_ask_before), ('after', best_bid, best_ask)):
+        buffer.append(dict(
+            Period=group.round_number,
+            orderID=group.orderID,
+            bestBid=bid,
+            bestAsk=ask,
+            BATime=ba_time,
+            timing=timing,
+            operationType=operation_type,
+        ))
+        if group.id in _admin_series:
+            add_admin_quotes(_admin_series[group.id], ba_time, bid, ask)
+    if len(buffer) >= C.bid_asks_buffer_size:
+        flush_bid_asks(group)
+
+
+def flush_bid_asks(group: Group):
+    # this code is run when a participant leaves the market page, at the results wait page and whenever a group's buffer is full.
+    # this function writes the buffered BidAsks observations of the group to the database.
+    with metrics.span('bid_asks.flush'):
+        for row in _bid_asks_buffers.pop(group.id, []):
+            BidAsks.create(group=group, **row)
+
+
+# Points of the admin report chart of the running markets, keyed by group id: trades, best bids and best asks as
+# SortedSeries of (x, y) points, x being the transactionTime or BATime. They are built from the database when the admin
+# report first asks for a group and appended to on every new trade and quote afterwards, such that refreshing the admin
+# report does not scan the Transaction and BidAsks tables. They are released with the market, see discard_market_state().
+_admin_series = {}
+# Last chart of the admin report per tuple of group ids, with the number of points it was drawn from.
+_admin_reports = {}
+
+
+def admin_series(group: Group):
+    # this code is run at the admin report.
+    # this function returns the group's chart points and restores them from the database if this process has none yet.
+    # the points are only kept while the group's market is running; the charts of closed markets are read when shown.
+    series = _admin_series.get(group.id)
+    if series is None:
+        series = dict(trades=SortedSeries(), bids=SortedSeries(), asks=SortedSeries())
+        for tx in Transaction.filter(group=group):
+            series['trades'].add(tx.transactionTime, tx.price)
+        bid_asks = [(b.BATime, b.bestBid, b.bestAsk) for b in BidAsks.filter(group=group)]
+        bid_asks += [(b['BATime'], b['bestBid'], b['bestAsk']) for b in _bid_asks_buffers.get(group.id, [])]
+        for ba_time, bid, ask in bid_asks:
+            add_admin_quotes(series, ba_time, bid, ask)
+        if group.id in _order_books:
+            _admin_series[group.id] = series
+    return series
+
+
+def add_admin_quotes(series, ba_time, bid, ask):
+    # this function adds a best bid and a best ask to the admin report chart, unless the time or the quote is missing.
+    if ba_time and bid:
+        series['bids'].add(ba_time, bid)
+    if ba_time and ask:
+        series['asks'].add(ba_time, ask)
+
+
+def admin_report_series(groups, since=None):
+    # this code is run at the admin report.
+    # this function returns the chart series of the groups, or only their points after the time since (BATime or
+    # transactionTime), e.g. for a chart that is extended by polling. Each series is downsampled to at most
+    # C.admin_chart_max_points points. The whole chart is only drawn again if the groups have new points.
+    group_series = [admin_series(group) for group in groups]
+    key = tuple(group.id for group in groups)
+    size = [len(series[name]) for series in group_series for name in ('trades', 'bids', 'asks')]
+    if since is None and key in _admin_reports and _admin_reports[key][0] == size:
+        return _admin_reports[key][1]
+    points = {name: lttb(merge_series([series[name] for series in group_series], since), C.admin_chart_max_points)
+              for name in ('trades', 'bids', 'asks')}
+    report = [
+        {'name': 'Trades', 'data': [{'x': x, 'y': y, 'name': 'Trades'} for x, y in points['trades']], 'type': 'scatter', 'id': 'trades', 'marker': {'symbol': 'circle'}},
+        {'name': 'Bids', 'data': [{'x': x, 'y': y, 'name': 'Bids'} for x, y in points['bids']], 'type': 'line', 'id': 'bids', 'lineWidth': 2},
+        {'name': 'Asks', 'data': [{'x': x, 'y': y, 'name': 'Asks'} for x, y in points['asks']], 'type': 'line', 'id': 'asks', 'lineWidth': 2},
+    ]
+    if since is None and all(group.id in _admin_series for group in groups):
+        _admin_reports[key] = (size, report)
+    return report
+
+
+def create_news(player: 'Player', msg: str):
+    # this code is run at the market page whenever an order is rejected.
+    # this function stores a message for the participant and queues it for the next update.
+    msg_time = round(float(time.time() - player.group.marketStartTime), C.decimals)
+    News.create(
+        player=player,
+        playerID=player.id_in_group,
+        group=player.group,
+        Period=player.group.round_number,
+        msg=msg,
+        msgTime=msg_time,
+    )
+    live_updates(player.group)['news'].append([msg, msg_time, player.id_in_group])
 
 
 class Player(BasePlayer):
@@ -379,20 +610,9 @@ class Player(BasePlayer):
 
 def asset_endowment(player: Player):
     # this code is run at the first WaitToStart page, within the initiate_player() function, when all participants arrived
-    # this function returns a participant's initial asset endowment
-    
-    # Calculate the number of trading rounds
-    num_trading_rounds = C.NUM_ROUNDS - C.num_trial_rounds
-    shock_round = (num_trading_rounds // 2) + C.num_trial_rounds + 1
-    
-    # Apply supply shock: reduction after 50% of trading rounds
-    if player.round_number >= shock_round:
-        # Apply shock intensity (e.g., 0.8 = 20% reduction)
-        base_endowment = int(random.uniform(a=C.num_assets_MIN, b=C.num_assets_MAX))
-        return int(base_endowment * C.supply_shock_intensity)
-    else:
-        # 100% of original endowment (no reduction)
-        return int(random.uniform(a=C.num_assets_MIN, b=C.num_assets_MAX))
+    # this function returns a participant's initial asset endowment, reduced by the supply shock after 50% of the
+    # trading rounds (see cda/rules.py)
+    return rules.asset_endowment(MARKET, player.round_number, random)
 
 
 def short_allowed(player: Player):
@@ -423,8 +643,7 @@ def calculate_gini_coefficient(values):
     Calculate the Gini coefficient for a list of values.
     Gini coefficient measures inequality: 0 = perfect equality, 1 = maximum inequality.
     
-    Uses the formula: G = (Σ Σ |x_i - x_j|) / (2 * n^2 * μ)
-    Where μ is the mean of all values.
+    Uses the sorted-cumulative form of G = (Σ Σ |x_i - x_j|) / (2 * n^2 * μ), see cda/inequality.py.
     
     Args:
         values: List of numerical values
@@ -432,32 +651,7 @@ def calculate_gini_coefficient(values):
     Returns:
         float: Gini coefficient (between 0 and 1)
     """
-    if not values or len(values) == 0:
-        return 0.0
-    
-    # Handle case where all values are the same (perfect equality)
-    if len(set(values)) == 1:
-        return 0.0
-    
-    n = len(values)
-    total_sum = sum(values)
-    
-    if total_sum == 0:
-        return 0.0
-    
-    mean = total_sum / n
-    
-    # Calculate sum of absolute differences between all pairs
-    abs_diff_sum = 0
-    for i in range(n):
-        for j in range(n):
-            abs_diff_sum += abs(values[i] - values[j])
-    
-    # Gini coefficient formula
-    gini = abs_diff_sum / (2 * n * n * mean)
-    
-    # Ensure result is between 0 and 1 (should be, but safety check)
-    return max(0.0, min(1.0, gini))
+    return gini(values)
 
 
 def distribute_heterogeneous_cash(group: Group):
@@ -469,65 +663,10 @@ def distribute_heterogeneous_cash(group: Group):
     
     Returns a dictionary mapping player.id_in_group to their cash amount.
     """
-    players = group.get_players()
-    group_size = len(players)
-    total_cash = C.cash_homogeneous * group_size
-    cash_distribution = {}
-    unrounded_amounts = []
-    
     # Sort players by id_in_group to ensure consistent distribution
-    sorted_players = sorted(players, key=lambda p: p.id_in_group)
-    
-    # First, calculate unrounded amounts for all players except the last
-    remaining_cash_unrounded = total_cash
-    for i, player in enumerate(sorted_players[:-1]):  # All except last
-        remaining_players = group_size - i - 1
-        # Minimum needed for remaining players (including last)
-        min_for_others = C.cash_MIN_heterogeneous * remaining_players
-        # Maximum available for this player
-        max_for_this = remaining_cash_unrounded - min_for_others
-        # Minimum for this player
-        min_for_this = C.cash_MIN_heterogeneous
-        
-        # Ensure max >= min (safety check)
-        if max_for_this < min_for_this:
-            max_for_this = min_for_this
-        
-        # Randomly assign between min and max (unrounded)
-        cash_amount_unrounded = random.uniform(a=min_for_this, b=max_for_this)
-        unrounded_amounts.append((player.id_in_group, cash_amount_unrounded))
-        remaining_cash_unrounded -= cash_amount_unrounded
-    
-    # Round all but the last player
-    allocated_rounded = 0.0
-    for player_id, unrounded in unrounded_amounts:
-        rounded = float(round(unrounded, C.decimals))
-        cash_distribution[player_id] = rounded
-        allocated_rounded += rounded
-    
-    # Last player gets exactly the remaining cash (ensures exact total)
-    last_player = sorted_players[-1]
-    last_player_amount = total_cash - allocated_rounded
-    
-    # Ensure last player gets at least minimum (should always be true given our constraints)
-    if last_player_amount < C.cash_MIN_heterogeneous:
-        # This shouldn't happen, but if it does, we need to adjust
-        # Take from the previous player(s) to ensure minimum
-        shortage = C.cash_MIN_heterogeneous - last_player_amount
-        if len(unrounded_amounts) > 0:
-            # Adjust the last assigned player
-            last_assigned_id = unrounded_amounts[-1][0]
-            cash_distribution[last_assigned_id] = max(
-                C.cash_MIN_heterogeneous,
-                cash_distribution[last_assigned_id] - shortage
-            )
-            # Recalculate
-            allocated_rounded = sum(cash_distribution.values())
-            last_player_amount = total_cash - allocated_rounded
-    
-    cash_distribution[last_player.id_in_group] = float(round(last_player_amount, C.decimals))
-    
-    return cash_distribution
+    sorted_players = sorted(group.get_players(), key=lambda p: p.id_in_group)
+    amounts = rules.heterogeneous_cash(MARKET, len(sorted_players), random)
+    return {p.id_in_group: amount for p, amount in zip(sorted_players, amounts)}
 
 
 def cash_endowment(player: Player):
@@ -622,142 +761,252 @@ def set_player(player: Player):
 
 def get_good_money_price(good: str) -> int:
     """Get money price for a good from constants."""
-    if good == 'A':
-        return C.GOOD_A_MONEY_PRICE
-    elif good == 'B':
-        return C.GOOD_B_MONEY_PRICE
-    else:
-        raise ValueError(f"Invalid good: {good}")
+    return rules.good_money_price(MARKET, good)
 
 def get_good_carbon_price(good: str) -> int:
     """Get carbon price for a good from constants."""
-    if good == 'A':
-        return C.GOOD_A_CARBON_PRICE
-    elif good == 'B':
-        return C.GOOD_B_CARBON_PRICE
-    else:
-        raise ValueError(f"Invalid good: {good}")
+    return rules.good_carbon_price(MARKET, good)
 
 def get_good_satisfaction(good: str, preference: str) -> int:
     """Get satisfaction points for a good based on player preference."""
-    if preference == 'conventional':
-        if good == 'A':
-            return C.SATISFACTION_CONVENTIONAL_GOOD_A
-        elif good == 'B':
-            return C.SATISFACTION_CONVENTIONAL_GOOD_B
-    elif preference == 'eco':
-        if good == 'A':
-            return C.SATISFACTION_ECO_GOOD_A
-        elif good == 'B':
-            return C.SATISFACTION_ECO_GOOD_B
-    else:
-        raise ValueError(f"Invalid preference: {preference}")
-    raise ValueError(f"Invalid good: {good}")
+    return rules.good_satisfaction(MARKET, good, preference)
 
 def calculate_goods_utility(player: Player):
     """
     Calculate total utility from goods based on player preference.
     Uses constants for satisfaction points.
     """
-    total_utility = 0
-    
     # Get player preference (default to 'conventional' if not set)
     # Use field_maybe_none() to safely handle None values
     preference = player.field_maybe_none('good_preference') or 'conventional'
-    
-    # Get satisfaction points from constants
-    goodA_satisfaction = get_good_satisfaction('A', preference)
-    goodB_satisfaction = get_good_satisfaction('B', preference)
-    
-    total_utility += player.goodA_qty * goodA_satisfaction
-    total_utility += player.goodB_qty * goodB_satisfaction
-    
-    return total_utility
+    return rules.goods_utility(MARKET, preference, dict(A=player.goodA_qty, B=player.goodB_qty))
 
 def live_method(player: Player, data):
     # this code is run at the market page whenever a participants updates the page or a new order is created.
+    # this function processes the message and measures it, see cda/metrics.py. oTree calls live_method() from the single
+    # event loop of the server process and waits for it to return, so the messages of a group are processed one at a
+    # time, from the checks of remaining volumes, holdings and caps in the order functions to the payloads sent back.
+    key = data.get('operationType') if isinstance(data, dict) else None
+    with metrics.span(f'live_method.{metric_label(key)}'):
+        return market_message(player, data)
+
+
+def market_message(player: Player, data):
+    # this code is run at the market page, within the live_method().
     # this function receives orders and processes them, furthermore, it sends the new order book to participant.
-    if not data or 'operationType' not in data:
+    # Clients that announce protocol='delta' in their market_start message receive a full snapshot only then and
+    # afterwards just the changes (see delta_update()), each numbered with a per-player sequence number.
+    # The acting participant is answered at once. The others receive at most one update per C.coalesce_window: changes
+    # within the window are queued for them, and they are told once to collect them with a 'flush' message (see
+    # coalesce()), such that a burst of orders reaches the group as one merged update per participant.
+    # Delta clients that also announce encoding='compact' receive their snapshots and deltas as positional arrays with
+    # prices in integer ticks (see cda/wire.py).
+    if not isinstance(data, dict) or not isinstance(data.get('operationType'), str):
         return
     key = data['operationType']
-    highcharts_series = []
+    label = metric_label(key)
     group = player.group
-    period = group.round_number
     players = group.get_players()
+    updates = live_updates(group)
+    result = dict()
+    with metrics.span(f'order.{label}'):
+        if key == 'market_start':
+            state = updates['players'].setdefault(player.id_in_group, dict(seq=0, holdings=None))
+            state.update(delta=data.get('protocol') == 'delta', pending=None, notified=False, sent=time.time())
+            state['compact'] = state['delta'] and data.get('encoding') == 'compact'
+        elif key == 'flush':
+            pass  # the queued changes of the sender are delivered below
+        elif key == 'batch':
+            result = batch(player, data)
+        else:
+            result = apply_operation(player, data)
+    book = order_book(group)
+    with metrics.span('bid_asks'):
+        best_bid_before = group.field_maybe_none('bestBid')
+        best_ask_before = group.field_maybe_none('bestAsk')
+        best_ask = book.best_ask()
+        group.bestAsk = best_ask  # None clears the group field when there are no asks
+        best_bid = book.best_bid()
+        group.bestBid = best_bid  # None clears the group field when there are no bids
+        record_bid_asks(group, key, best_bid_before, best_ask_before, best_bid, best_ask)
+    if key == 'market_start':
+        players = [player]
+    snapshot = None
+    book_changes = list(book.changes)
+    payloads = {}  # the next lines define the information send to participants
+    with metrics.span(f'payloads.{label}'):
+        for p in players:
+            state = updates['players'].get(p.id_in_group)
+            goods_trade = result if p.id_in_group == player.id_in_group else dict()
+            if state is None or not state['delta'] or key == 'market_start':
+                if snapshot is None:
+                    with metrics.span('snapshot'):
+                        snapshot = market_snapshot(group)
+                payloads[p.id_in_group] = full_update(p, snapshot, goods_trade)
+                if state is not None and state['delta']:
+                    payloads[p.id_in_group].update(snapshot=True, seq=state['seq'])
+                    state['holdings'] = player_holdings(p)
+                    if state.get('compact'):
+                        payloads[p.id_in_group] = wire.encode(payloads[p.id_in_group], 10 ** C.decimals)
+            else:
+                queue_changes(p, state, book_changes, updates)
+                if p.id_in_group != player.id_in_group and coalesce(state):
+                    if not state['notified']:
+                        state['notified'] = True
+                        flush_ms = int(1000 * (state['sent'] + C.coalesce_window - time.time())) + 1
+                        payloads[p.id_in_group] = dict(pending=True, flush_ms=flush_ms)
+                    continue
+                delta = delta_update(p, state, goods_trade)
+                if delta:
+                    payloads[p.id_in_group] = wire.encode(delta, 10 ** C.decimals) if state.get('compact') else delta
+    if metrics.enabled:
+        metrics.observe(f'payload_bytes.{label}', len(json.dumps(payloads, default=str)))
+    book.changes.clear()
+    updates['trades'].clear()
+    updates['news'].clear()
+    return payloads
+
+
+def apply_operation(player: Player, data):
+    # this code is run at the market page, within the live_method() and batch().
+    # this function passes one operation to its order function and returns the result of a good purchase, if any.
+    key = data['operationType']
+    if misspecified(data):
+        create_news(player, 'Cannot proceed: misspecified order.')
+        return dict()
     if key == 'limit_order':
         limit_order(player, data)
     elif key == 'cancel_limit':
         cancel_limit(player, data)
+    elif key == 'cancel_all':
+        cancel_all(player)
     elif key == 'market_order':
         transaction(player, data)
     elif key == 'buy_good':
-        result = buy_good(player, data)  # Get the result from buy_good
-    offers = Limit.filter(group=group)
-    transactions = Transaction.filter(group=group)
-    if transactions:
-        hc_data = [{'x': tx.transactionTime, 'y': tx.price, 'name': 'Trades'} for tx in Transaction.filter(group=group)]
+        return buy_good(player, data)  # Get the result from buy_good
+    return dict()
+
+
+def batch(player: Player, data):
+    # this code is run at the market page, within the live_method(), when a batch message arrives.
+    # this function applies the operations of {'operationType': 'batch', 'operations': [...]} in their order. They are
+    # processed within one call of the live_method() like a single message, so no other message comes in between, and the group
+    # receives one update for all of them. The whole batch is rejected before anything is applied if an operation is
+    # unknown or misspecified. Otherwise each operation is checked as if sent alone; an operation rejected then (e.g.,
+    # for insufficient cash) creates its news item and does not stop the following ones. A batch is therefore not
+    # atomic: the operations applied before a rejected one stay applied.
+    operations = data.get('operations')
+    error = batch_error(operations, C.batch_max_operations)  # see cda/operations.py
+    if error:
+        create_news(player, error)
+        return dict()
+    result = dict()
+    for operation in operations:
+        with metrics.span(f'order.batch.{operation["operationType"]}'):
+            result = apply_operation(player, operation) or result
+    return result
+
+
+def market_snapshot(group: Group):
+    # this code is run at the market page, within the live_method(), when at least one participant needs the full market state.
+    # this function collects the group's order book, trade chart and messages once for all recipients.
+    book = order_book(group)
+    trades = trade_history(group)['all']
+    highcharts_series = []
+    if trades:
+        # the chart shows the course of prices, so long rounds are downsampled to C.chart_max_points trades
+        hc_data = [{'x': x, 'y': y, 'name': 'Trades'} for x, y in lttb([(t[2], t[0]) for t in trades], C.chart_max_points)]
         highcharts_series.append({'name': 'Trades', 'data': hc_data})
-    else:
-        highcharts_series = []
-    best_bid = group.field_maybe_none('bestBid')
-    best_ask = group.field_maybe_none('bestAsk')
-    BidAsks.create(  # observe Bids and Asks of respective asset before the request
-        group=group,
-        Period=period,
-        orderID=group.subsession.orderID,
-        bestBid=best_bid,
-        bestAsk=best_ask,
-        BATime=round(float(time.time() - player.group.marketStartTime), C.decimals),
-        timing='before',
-        operationType=key,
+    return dict(
+        bids=book.bids(),
+        asks=book.asks(),
+        highcharts_series=highcharts_series,
+        msgs=News.filter(group=group),
     )
-    bids = sorted([[offer.price, offer.remainingVolume, offer.offerID, offer.makerID] for offer in offers if offer.isActive and offer.isBid], reverse=True, key=itemgetter(0))
-    asks = sorted([[offer.price, offer.remainingVolume, offer.offerID, offer.makerID] for offer in offers if offer.isActive and not offer.isBid], key=itemgetter(0))
-    msgs = News.filter(group=group)
-    if asks:
-        best_ask = asks[0][0]
-        group.bestAsk = best_ask
-    else:
-        best_ask = None
-        group.bestAsk = None  # Clear the group field when no asks
-    if bids:
-        best_bid = bids[0][0]
-        group.bestBid = best_bid
-    else:
-        best_bid = None
-        group.bestBid = None  # Clear the group field when no bids
-    BidAsks.create(  # observe Bids and Asks of respective asset after the request
-        group=group,
-        Period=period,
-        orderID=group.subsession.orderID,
-        bestBid=best_bid,
-        bestAsk=best_ask,
-        BATime=round(float(time.time() - player.group.marketStartTime), C.decimals),
-        timing='after',
-        operationType=key,
+
+
+def player_holdings(p: Player):
+    # this function returns the holdings of a participant as displayed at the market page.
+    return dict(
+        cashHolding=f"{p.cashHolding:.{C.decimals}f}",
+        assetsHolding=p.assetsHolding,
+        goodA_qty=p.goodA_qty,
+        goodB_qty=p.goodB_qty,
+        goods_utility=p.goods_utility,
+        overall_utility=f"{p.overall_utility:.{C.decimals}f}",
     )
-    if key == 'market_start':
-        players = [player]
-    return {  # the next lines define the information send to participants
-        p.id_in_group: dict(
-            bids=bids,
-            asks=asks,
-            trades=sorted([[t.price, t.transactionVolume, t.transactionTime, t.sellerID] for t in transactions if (t.makerID == p.id_in_group or t.takerID == p.id_in_group)], reverse = True, key=itemgetter(2)),
-            cashHolding=f"{p.cashHolding:.{C.decimals}f}",
-            assetsHolding=p.assetsHolding,
-            goodA_qty=p.goodA_qty,
-            goodB_qty=p.goodB_qty,
-            goods_utility=p.goods_utility,
-            overall_utility=f"{p.overall_utility:.{C.decimals}f}",
-            highcharts_series=highcharts_series,
-            news=sorted([[m.msg, m.msgTime, m.playerID] for m in msgs if m.playerID == p.id_in_group], reverse=True, key=itemgetter(1)),
-            # Add goods trade info if this player just made a purchase
-            goods_trade_good=result.get('goods_trade_good') if key == 'buy_good' and p.id_in_group == player.id_in_group else None,
-            goods_trade_qty=result.get('goods_trade_qty') if key == 'buy_good' and p.id_in_group == player.id_in_group else None,
-            goods_trade_price=result.get('goods_trade_price') if key == 'buy_good' and p.id_in_group == player.id_in_group else None
+
+
+def full_update(p: Player, snapshot, goods_trade):
+    # this function returns the complete market state for one participant.
+    update = dict(
+        bids=snapshot['bids'],
+        asks=snapshot['asks'],
+        trades=recent_trades(p.group, p.id_in_group),
+        **player_holdings(p),
+        highcharts_series=snapshot['highcharts_series'],
+        chart_max_points=C.chart_max_points,
+        news=sorted([[m.msg, m.msgTime, m.playerID] for m in snapshot['msgs'] if m.playerID == p.id_in_group], reverse=True, key=itemgetter(1)),
+    )
+    # Add goods trade info if this player just made a purchase
+    if goods_trade.get('goods_trade_good'):
+        update.update(
+            goods_trade_good=goods_trade['goods_trade_good'],
+            goods_trade_qty=goods_trade['goods_trade_qty'],
+            goods_trade_price=goods_trade['goods_trade_price'],
         )
-        for p in players
-    }
+    return update
+
+
+def queue_changes(p: Player, state, book_changes, updates):
+    # this function adds the book changes, trades and own messages of the current request to those not yet sent to a participant.
+    pending = state.get('pending')
+    if pending is None:
+        pending = state['pending'] = dict(book=[], trades=[], news=[])
+    pending['book'] += book_changes
+    pending['trades'] += updates['trades']
+    pending['news'] += [n for n in updates['news'] if n[2] == p.id_in_group]
+
+
+def coalesce(state):
+    # this function tells whether the update of a participant who did not act is held back, because they received one
+    # less than C.coalesce_window seconds ago.
+    return bool(C.coalesce_window) and time.time() - state.get('sent', 0) < C.coalesce_window
+
+
+def delta_update(p: Player, state, goods_trade):
+    # this function returns what changed for one participant since the last update, or None if nothing did.
+    pending = state.get('pending') or dict(book=[], trades=[], news=[])
+    state.update(pending=None, notified=False)
+    delta = dict()
+    if pending['book']:
+        delta['book'] = pending['book']
+    if pending['trades']:
+        delta['chart'] = [{'x': t['row'][2], 'y': t['row'][0], 'name': 'Trades'} for t in pending['trades']]
+        trades = [t['row'] for t in reversed(pending['trades']) if p.id_in_group in (t['maker'], t['taker'])]
+        if trades:
+            delta['trades'] = trades
+    news = pending['news'][::-1]
+    if news:
+        delta['news'] = news
+    holdings = player_holdings(p)
+    last_holdings = state['holdings'] or dict()
+    changed = {k: v for k, v in holdings.items() if last_holdings.get(k) != v}
+    if changed:
+        delta.update(changed)
+        state['holdings'] = holdings
+    if goods_trade.get('goods_trade_good'):
+        delta.update(
+            goods_trade_good=goods_trade['goods_trade_good'],
+            goods_trade_qty=goods_trade['goods_trade_qty'],
+            goods_trade_price=goods_trade['goods_trade_price'],
+        )
+    if not delta:
+        return None
+    state['seq'] += 1
+    state['sent'] = time.time()
+    delta['seq'] = state['seq']
+    return delta
 
 
 def calc_period_profits(player: Player):
@@ -779,6 +1028,33 @@ def calc_period_profits(player: Player):
     # Note: Payoff is no longer calculated here - it's determined at the end based on group comparison
 
 
+def score_matrix(group: Group):
+    # this code is run at the results wait page and the final results page.
+    # this function returns the group's score matrix {id_in_group: [Score Change % per trading round so far]}.
+    return {int(k): v for k, v in json.loads(group.scoreMatrix).items()} if group.scoreMatrix else {}
+
+
+def update_score_matrix(group: Group, players):
+    # this code is run at the results wait page after calc_period_profits().
+    # this function extends the previous round's score matrix by the Score Change % of this round, such that the final
+    # results read all rounds of all group members from one field instead of scanning every player's rounds.
+    # Groups are kept like round 1 (see FormTradingGroups), so id_in_group identifies a participant across rounds.
+    trading_round = group.round_number - C.num_trial_rounds
+    if trading_round < 1:
+        return
+    matrix = score_matrix(group.in_round(group.round_number - 1)) if trading_round > 1 else {}
+    if trading_round > 1 and not matrix:
+        # previous rounds were played without a matrix (e.g. a session started before it existed), rebuild it once
+        for p in players:
+            matrix[p.id_in_group] = [rp.field_maybe_none('utilityChangePercent') or 0 for rp in p.in_previous_rounds()
+                                     if rp.round_number > C.num_trial_rounds]
+    for p in players:
+        scores = matrix.setdefault(p.id_in_group, [])
+        scores.extend([0] * (trading_round - 1 - len(scores)))  # players without a score in a round count as 0
+        scores.append(p.field_maybe_none('utilityChangePercent') or 0)
+    group.scoreMatrix = json.dumps(matrix)
+
+
 def calc_final_profit(group: Group):
     # this code is run at the final results wait page after all players arrive.
     # this function randomly selects a round and determines the winner within the group.
@@ -790,11 +1066,11 @@ def calc_final_profit(group: Group):
     if not participating_players:
         return  # No participating players, skip calculation
     
-    # Get trading rounds (exclude trial rounds) - use first player as reference
-    first_player = participating_players[0]
-    trading_rounds = [p for p in first_player.in_all_rounds() if p.round_number > C.num_trial_rounds]
+    # Score Change % of every player and trading round, built up by update_score_matrix()
+    matrix = score_matrix(group)
+    num_trading_rounds = max((len(scores) for scores in matrix.values()), default=0)
     
-    if not trading_rounds:
+    if not num_trading_rounds:
         # Fallback if no trading rounds (shouldn't happen)
         for p in participating_players:
             p.selectedRound = 1
@@ -802,32 +1078,18 @@ def calc_final_profit(group: Group):
             p.isWinner = False
         return
     
-    # Randomly select a round (same for all players in the group)
-    # Use random.choice() for more reliable random selection
-    selected_round_player = random.choice(trading_rounds)
-    selected_round_number = selected_round_player.round_number
+    # Randomly select a round (same for all players in the group), as display round number (1-based, excluding trial rounds)
+    selected_round = random.randint(1, num_trading_rounds)
     
     # Store selected round for all players
     for p in participating_players:
-        # Convert to display round number (1-based, excluding trial rounds)
-        p.selectedRound = selected_round_number - C.num_trial_rounds
+        p.selectedRound = selected_round
     
-    # Find Score Change % for each player in the selected round
+    # Find Score Change % for each player in the selected round (0 if the player has no score)
     player_scores = []
     for p in participating_players:
-        # Find the player's round data for the selected round
-        selected_round_player = None
-        for round_player in p.in_all_rounds():
-            if round_player.round_number == selected_round_number:
-                selected_round_player = round_player
-                break
-        
-        if selected_round_player:
-            score_change = selected_round_player.utilityChangePercent
-            player_scores.append((p, score_change))
-        else:
-            # Fallback: no score found
-            player_scores.append((p, 0))
+        scores = matrix.get(p.id_in_group, [])
+        player_scores.append((p, scores[selected_round - 1] if selected_round <= len(scores) else 0))
     
     # Find the maximum Score Change % in the group
     max_score_change = max(score for _, score in player_scores) if player_scores else 0
@@ -855,37 +1117,69 @@ def calc_final_profit(group: Group):
             p.payoff = C.base_payment + C.bonus_payment  # Also set oTree's standard payoff field
 
 
+def export_groups(players):
+    # this code is run at the customised data download.
+    # this function collects each exported group once, together with its session code and its participating players.
+    groups = {}
+    for p in players:
+        group = p.group
+        if group.id not in groups:
+            groups[group.id] = dict(group=group, session_code=group.session.code, players=[])
+        if p.isParticipating and not p.isObserver:
+            groups[group.id]['players'].append(p)
+    return sorted(groups.values(), key=lambda g: (g['session_code'], g['group'].round_number, g['group'].id_in_subsession))
+
+
+def export_table(model, groups, row):
+    # this code is run at the customised data download.
+    # this function yields the rows of one table group by group, such that only the records of one group are loaded at a time.
+    for g in groups:
+        group = g['group']
+        for record in model.filter(group=group):
+            yield row(record, g['session_code'], group)
+
+
 def custom_export(players):
     # this function defines the variables that are downloaded in customised tables
+    # group and session metadata are looked up once per group instead of once per row
+    groups = export_groups(players)
+
     # Export Limits
-    yield ['TableName', 'sessionID', 'offerID', 'group', 'Period', 'maker', 'price', 'limitVolume', 'isBid', 'offerID', 'orderID', 'offerTime', 'remainingVolume', 'isActive', 'bestAskBefore', 'bestBidBefore', 'bestAskAfter', 'bestBidAfter']
-    limits = Limit.filter()
-    for l in limits:
-        yield ['Limits', l.group.session.code, l.offerID, l.group.id_in_subsession, l.group.round_number, l.makerID, l.price, l.limitVolume, l.isBid, l.orderID, l.offerTime, l.remainingVolume, l.isActive, l.bestAskBefore, l.bestBidBefore, l.bestAskAfter, l.bestBidAfter]
+    yield ['TableName', 'sessionID', 'offerID', 'group', 'Period', 'maker', 'price', 'limitVolume', 'isBid', 'orderID', 'offerTime', 'remainingVolume', 'isActive', 'bestAskBefore', 'bestBidBefore', 'bestAskAfter', 'bestBidAfter']
+    yield from export_table(Limit, groups, lambda l, code, group: [
+        'Limits', code, l.offerID, group.id_in_subsession, group.round_number, l.makerID, l.price, l.limitVolume, l.isBid, l.orderID, l.offerTime, l.remainingVolume, l.isActive, l.bestAskBefore, l.bestBidBefore, l.bestAskAfter, l.bestBidAfter])
 
     # Export Transactions
     yield ['TableName', 'sessionID', 'transactionID', 'group', 'Period', 'maker', 'taker', 'price', 'transactionVolume', 'limitVolume', 'sellerID', 'buyerID', 'isBid', 'offerID', 'orderID', 'offerTime', 'transactionTime', 'remainingVolume', 'isActive', 'bestAskBefore', 'bestBidBefore', 'bestAskAfter', 'bestBidAfter']
-    trades = Transaction.filter()
-    for t in trades:
-        yield ['Transactions', t.group.session.code, t.transactionID, t.group.id_in_subsession, t.group.round_number, t.makerID, t.takerID, t.price, t.transactionVolume, t.limitVolume, t.sellerID, t.buyerID, t.isBid, t.offerID, t.orderID, t.offerTime, t.transactionTime, t.remainingVolume, t.isActive, t.bestAskBefore, t.bestBidBefore, t.bestAskAfter, t.bestBidAfter]
+    yield from export_table(Transaction, groups, lambda t, code, group: [
+        'Transactions', code, t.transactionID, group.id_in_subsession, group.round_number, t.makerID, t.takerID, t.price, t.transactionVolume, t.limitVolume, t.sellerID, t.buyerID, t.isBid, t.offerID, t.orderID, t.offerTime, t.transactionTime, t.remainingVolume, t.isActive, t.bestAskBefore, t.bestBidBefore, t.bestAskAfter, t.bestBidAfter])
 
     # Export Orders
-    yield ['TableName', 'sessionID', 'orderID', 'orderType', 'group', 'Period', 'maker', 'taker', 'price', 'transactionVolume', 'limitVolume', 'sellerID', 'buyerID', 'isBid', 'offerID', 'transactionID', 'offerTime', 'transactionTime', 'remainingVolume', 'isActive', 'bestAskBefore', 'bestBidBefore', 'bestAskAfter', 'bestBidAfter']
-    orders = Order.filter()
-    for o in orders:
-        yield ['Orders', o.group.session.code, o.orderID, o.orderType, o.group.id_in_subsession, o.group.round_number, o.makerID, o.takerID, o.price, o.transactionVolume, o.limitVolume, o.sellerID, o.buyerID, o.isBid, o.offerID, o.transactionID, o.offerTime, o.transactionTime, o.remainingVolume, o.isActive, o.bestAskBefore, o.bestBidBefore, o.bestAskAfter, o.bestBidAfter]
+    yield ['TableName', 'sessionID', 'orderID', 'orderType', 'group', 'Period', 'maker', 'taker', 'price', 'transactionVolume', 'limitVolume', 'sellerID', 'buyerID', 'isBid', 'offerID', 'transactionID', 'offerTime', 'transactionTime', 'remainingVolume', 'isActive', 'bestAskBefore', 'bestBidBefore', 'bestAskAfter', 'bestBidAfter', 'orderTime']
+    yield from export_table(Order, groups, lambda o, code, group: [
+        'Orders', code, o.orderID, o.orderType, group.id_in_subsession, group.round_number, o.makerID, o.takerID, o.price, o.transactionVolume, o.limitVolume, o.sellerID, o.buyerID, o.isBid, o.offerID, o.transactionID, o.offerTime, o.transactionTime, o.remainingVolume, o.isActive, o.bestAskBefore, o.bestBidBefore, o.bestAskAfter, o.bestBidAfter, o.orderTime])
 
-    # Export BidAsk
+    # Export BidAsk, including observations of running markets that are not yet written to the database
     yield ['TableName', 'sessionID', 'orderID', 'operationType', 'group', 'Period', 'bestAsk', 'bestBid', 'BATime', 'timing']
-    bidasks = BidAsks.filter()
-    for b in bidasks:
-        yield ['BidAsks', b.group.session.code, b.orderID, b.operationType, b.group.id_in_subsession, b.group.round_number, b.bestAsk, b.bestBid, b.BATime, b.timing]
+    for g in groups:
+        group = g['group']
+        for b in BidAsks.filter(group=group):
+            yield ['BidAsks', g['session_code'], b.orderID, b.operationType, group.id_in_subsession, group.round_number, b.bestAsk, b.bestBid, b.BATime, b.timing]
+        for b in list(_bid_asks_buffers.get(group.id, [])):
+            yield ['BidAsks', g['session_code'], b['orderID'], b['operationType'], group.id_in_subsession, group.round_number, b['bestAsk'], b['bestBid'], b['BATime'], b['timing']]
 
     # Export News
     yield ['TableName', 'sessionID', 'message', 'group', 'Period', 'playerID', 'msgTime']
-    news = News.filter()
-    for n in news:
-        yield ['BidAsks', n.group.session.code, n.msg, n.group.id_in_subsession, n.group.round_number, n.playerID, n.msgTime]
+    yield from export_table(News, groups, lambda n, code, group: [
+        'News', code, n.msg, group.id_in_subsession, group.round_number, n.playerID, n.msgTime])
+
+    # Export Inequality of endowments, holdings and utilities per group and period
+    yield ['TableName', 'sessionID', 'group', 'Period', 'variable', 'numPlayers'] + MEASURES
+    groups = [g for g in groups if g['players']]
+    for field in ['initialCash', 'cashHolding', 'assetsHolding', 'overall_utility']:
+        values = [[getattr(p, field) for p in g['players']] for g in groups]
+        for g, group_values, measures in zip(groups, values, inequality_batch(values)):
+            yield ['Inequality', g['session_code'], g['group'].id_in_subsession, g['group'].round_number, field, len(group_values)] + [measures[m] for m in MEASURES]
 
 
 class Limit(ExtraModel):
@@ -912,83 +1206,41 @@ class Limit(ExtraModel):
 def limit_order(player: Player, data):
     # this code is run at the market page, within the live_method(), whenever a participants aimes to create a limit order.
     # this function processes limit orders and creates new entries in the Limit and Order tables.
+    # A limit order that reaches the other side of the book is first filled against it (see match_limit_order()),
+    # and only the remaining volume is placed as an offer.
     maker_id = player.id_in_group
     group = player.group
     period = group.round_number
     if player.isObserver:
-        News.create(
-            player=player,
-            playerID=maker_id,
-            group=group,
-            Period=period,
-            msg='Cannot proceed: you are an observer who cannot place a bid/ask.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+        create_news(player, 'Cannot proceed: you are an observer who cannot place a bid/ask.')
         return
     if not (data['isBid'] >= 0 and data['limitPrice'] and data['limitVolume']):
-        News.create(
-            player=player,
-            playerID=maker_id,
-            group=group,
-            Period=period,
-            msg='Cannot proceed: misspecified price, volume or asset.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+        create_news(player, 'Cannot proceed: misspecified price, volume or asset.')
         return
     price = round(float(data['limitPrice']), C.decimals)
     is_bid = bool(data['isBid'] == 1)
     limit_volume = int(data['limitVolume'])
     if not (price > 0 and limit_volume > 0):
-        News.create(
-            player=player,
-            playerID=maker_id,
-            group=group,
-            Period=period,
-            msg='Cannot proceed: misspecified price or volume.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+        create_news(player, 'Cannot proceed: misspecified price or volume.')
         return
     if is_bid and player.cashHolding + player.capLong - player.cashOffered - limit_volume * price < 0:
-        News.create(
-            player=player,
-            playerID=maker_id,
-            group=group,
-            Period=period,
-            msg='Cannot proceed: insufficient cash available.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+        create_news(player, 'Cannot proceed: insufficient cash available.')
         return
-    best_ask_before = group.field_maybe_none('bestAsk')
-    best_bid_before = group.field_maybe_none('bestBid')
     if not is_bid and player.assetsHolding + player.capShort - player.assetsOffered - limit_volume < 0:
-        News.create(
-            player=player,
-            playerID=maker_id,
-            group=group,
-            Period=period,
-            msg='Cannot proceed: insufficient assets available.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+        create_news(player, 'Cannot proceed: insufficient assets available.')
         return
-    elif (is_bid and best_ask_before is not None and price > best_ask_before) or (not is_bid and best_bid_before is not None and price < best_bid_before):
-        News.create(
-            player=player,
-            playerID=maker_id,
-            group=group,
-            Period=period,
-            msg='Cannot proceed: there is a buy/sell offer with the same or a more interesting price available.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+    book = order_book(group)
+    limit_volume, rejected = match_limit_order(player, book, is_bid, price, limit_volume)
+    if not limit_volume or rejected:  # a rejected fill has created its news item, the rest is not placed
         return
-    offer_id = player.subsession.offerID + 1
-    player.subsession.offerID += 1
-    while len(Limit.filter(group=group, offerID=offer_id)) > 0:  # to prevent duplicates in offerID
-        offer_id += 1
+    if limit_crosses(book, is_bid, price):  # only own offers are left at this price or a better one
+        create_news(player, 'Cannot proceed: the remaining volume would meet your own buy/sell offer.')
+        return
+    best_ask_before = book.best_ask()
+    best_bid_before = book.best_bid()
+    offer_id = next_id(group, 'offerID')
     offer_time = round(float(time.time() - player.group.marketStartTime), C.decimals)
-    order_id = player.subsession.orderID + 1
-    player.subsession.orderID += 1
-    while len(Order.filter(group=group, offerID=order_id)) > 0:  # to prevent duplicates in orderID
-        order_id += 1
+    order_id = next_id(group, 'orderID')
     if best_ask_before:
         best_ask_after = best_ask_before
     else:
@@ -1043,6 +1295,7 @@ def limit_order(player: Player, data):
         bestAskAfter=best_ask_after,
         bestBidAfter=best_bid_after,
     )
+    book.add(offer_id, price, limit_volume, maker_id, is_bid)
     player.limitOrders += 1
     player.limitVolume += limit_volume
     group.limitOrders += 1
@@ -1061,6 +1314,20 @@ def limit_order(player: Player, data):
         group.limitSellVolume += limit_volume
 
 
+def match_limit_order(player: Player, book, is_bid, price, volume):
+    # this code is run at the market page, within the limit_order() function.
+    # this function fills a limit order against the other side of the book in price-time priority, one transaction()
+    # per offer at the offer's price, and returns the volume that remains to be placed as an offer and whether a fill
+    # was rejected. The participant's own offers are skipped; matching stops at the first rejected fill.
+    def fill(entry, volume):
+        offer_id, remaining = entry[2], entry[1]
+        transaction(player, dict(offerID=offer_id, transactionVolume=volume))
+        entry = book.get(offer_id)
+        return (entry[1] if entry else 0) == remaining - volume  # otherwise transaction() created a news item
+
+    return match_order(book, is_bid, price, volume, player.id_in_group, fill)
+
+
 def cancel_limit(player: Player, data):
     # this code is run at the market page, within the live_method(), whenever a participants aimes to create a limit order.
     # this function processes limit order withdrawals and creates new entries in the Order table.
@@ -1068,48 +1335,44 @@ def cancel_limit(player: Player, data):
         return
     maker_id = int(data['makerID'])
     group = player.group
-    period = group.round_number
     if player.isObserver:
-        News.create(
-            player=player,
-            playerID=maker_id,
-            group=group,
-            Period=period,
-            msg='Cannot proceed: you are an observer who cannot withdraw a bid/ask.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+        create_news(player, 'Cannot proceed: you are an observer who cannot withdraw a bid/ask.')
         return
     if maker_id != player.id_in_group:
-        News.create(
-            player=player,
-            playerID=player.id_in_group,
-            group=group,
-            Period=period,
-            msg='Cannot proceed: you can withdraw your own buy/sell offers only.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+        create_news(player, 'Cannot proceed: you can withdraw your own buy/sell offers only.')
         return
     offer_id = int(data['offerID'])
+    book = order_book(group)
+    if offer_id not in book:  # the offer has already been withdrawn or transacted
+        return
     # we need to update Limit table entry
-    offers = [o for o in Limit.filter(group=group) if o.offerID == offer_id]
+    offers = Limit.filter(group=group, offerID=offer_id)
     if not offers or len(offers) != 1:
         return
-    offers[0].isActive = False
-    is_bid = offers[0].isBid
-    limit_volume = offers[0].limitVolume
-    remaining_volume = offers[0].remainingVolume
-    price = offers[0].price
-    transacted_volume = offers[0].transactedVolume
-    offer_time = offers[0].offerTime
-    order_id = player.subsession.orderID + 1
-    player.subsession.orderID += 1
-    while len(Order.filter(group=group, offerID=order_id)) > 0:  # to prevent duplicates in orderID
-        order_id += 1
-    best_ask_before = group.field_maybe_none('bestAsk')
-    best_bid_before = group.field_maybe_none('bestBid')
-    limitoffers = Limit.filter(group=group)
-    best_bid_after = max([offer.price for offer in limitoffers if offer.isActive and offer.isBid] or [-1])
-    best_ask_after = min([offer.price for offer in limitoffers if offer.isActive and not offer.isBid] or [-1])
+    withdraw_offer(player, book, offers[0])
+
+
+def withdraw_offer(player: Player, book, limit_entry):
+    # this code is run at the market page, within the cancel_limit() and cancel_all() functions.
+    # this function removes the player's offer of limit_entry from the order book, deactivates the Limit entry,
+    # creates the cancellation in the Order table and releases the cash or assets locked in the offer.
+    group = player.group
+    period = group.round_number
+    offer_id = limit_entry.offerID
+    maker_id = player.id_in_group
+    best_ask_before = book.best_ask()
+    best_bid_before = book.best_bid()
+    book.remove(offer_id)
+    limit_entry.isActive = False
+    is_bid = limit_entry.isBid
+    limit_volume = limit_entry.limitVolume
+    remaining_volume = limit_entry.remainingVolume
+    price = limit_entry.price
+    transacted_volume = limit_entry.transactedVolume
+    offer_time = limit_entry.offerTime
+    order_id = next_id(group, 'orderID')
+    best_bid_after = book.best_bid() or -1
+    best_ask_after = book.best_ask() or -1
     if not best_ask_before:
         best_ask_before = -1
     if not best_bid_before:
@@ -1145,6 +1408,19 @@ def cancel_limit(player: Player, data):
         player.assetsOffered -= remaining_volume
 
 
+def cancel_all(player: Player):
+    # this code is run at the market page, within the live_method(), whenever a participant withdraws all own offers.
+    # this function withdraws the participant's offers, found with one query of the own active Limit entries, and
+    # then releases the cash and assets locked in offers at once. Each withdrawal is still recorded in the Order table.
+    book = order_book(player.group)
+    for limit_entry in Limit.filter(group=player.group, makerID=player.id_in_group, isActive=True):
+        if limit_entry.offerID in book:  # skips duplicates and offers transacted in the meantime
+            withdraw_offer(player, book, limit_entry)
+    if not any(entry[3] == player.id_in_group for entry in book.offers.values()):
+        player.cashOffered = 0  # also clears rounding residues of the subtractions in cancel_limit()
+        player.assetsOffered = 0
+
+
 class Order(ExtraModel):
     orderID = models.IntegerField()
     offerID = models.IntegerField()
@@ -1201,92 +1477,62 @@ class Transaction(ExtraModel):
 def transaction(player: Player, data):
     # this code is run at the market page, within the live_method(), whenever a participants aimes to acccept a limit order, i.e., when a market order is made.
     # this function processes market orders and creates new entries in the Transaction and Order tables, and updates the Limit table.
+    # Market orders without an offerID are sweep orders, see sweep_order().
     if 'offerID' not in data:
+        sweep_order(player, data)
         return
     offer_id = int(data['offerID'])
     taker_id = player.id_in_group
     group = player.group
-    period = group.round_number
     if player.isObserver:
-        News.create(
-            player=player,
-            playerID=taker_id,
-            group=group,
-            Period=period,
-            msg='Cannot proceed: you are an observer who cannot accept a bid/ask.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+        create_news(player, 'Cannot proceed: you are an observer who cannot accept a bid/ask.')
         return
-    limit_entry = Limit.filter(group=group, offerID=offer_id)
-    if len(limit_entry) > 1:
-        limit_entry = limit_entry[0]  # Use first entry if duplicates exist
-    else:
-        limit_entry = limit_entry[0]
+    book = order_book(group)
+    if offer_id not in book:  # the offer has been withdrawn or transacted in the meantime
+        return
+    limit_entry = Limit.filter(group=group, offerID=offer_id)[0]  # use first entry if duplicates exist
     transaction_volume = int(data['transactionVolume'])
     is_bid = limit_entry.isBid
     price = float(limit_entry.price)
     maker_id = int(limit_entry.makerID)
     remaining_volume = int(limit_entry.remainingVolume)
-    limit_volume = int(limit_entry.limitVolume)
     if not (price > 0 and transaction_volume > 0): # check whether data is valid
-        News.create(
-            player=player,
-            playerID=taker_id,
-            group=group,
-            Period=period,
-            msg='Cannot proceed: misspecified volume.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+        create_news(player, 'Cannot proceed: misspecified volume.')
         return
-    is_active = limit_entry.isActive
-    if transaction_volume >= remaining_volume:
-        transaction_volume = remaining_volume
-        is_active = False
+    transaction_volume = min(transaction_volume, remaining_volume)
     if not is_bid and player.cashHolding + player.capLong - player.cashOffered - transaction_volume * price < 0:
-        News.create(
-            player=player,
-            playerID=taker_id,
-            group=group,
-            Period=period,
-            msg='Cannot proceed: insufficient cash available.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+        create_news(player, 'Cannot proceed: insufficient cash available.')
         return
-    best_ask_before = group.field_maybe_none('bestAsk')
-    best_bid_before = group.field_maybe_none('bestBid')
     if is_bid and player.assetsHolding + player.capShort - player.assetsOffered - transaction_volume < 0:
-        News.create(
-            player=player,
-            playerID=taker_id,
-            group=group,
-            Period=period,
-            msg='Cannot proceed: insufficient assets available.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+        create_news(player, 'Cannot proceed: insufficient assets available.')
         return
     elif maker_id == taker_id:
-        News.create(
-            player=player,
-            playerID=taker_id,
-            group=group,
-            Period=period,
-            msg='Cannot proceed: own buy/selloffers cannot be transacted.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+        create_news(player, 'Cannot proceed: own buy/selloffers cannot be transacted.')
         return
-    if (is_bid and best_bid_before and price < best_bid_before) or (not is_bid and best_ask_before and price > best_ask_before) :
-        News.create(
-            player=player,
-            playerID=taker_id,
-            group=group,
-            Period=period,
-            msg='Cannot proceed: there is a better buy/sell offer available.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+    if better_offer_available(book, is_bid, price, taker_id):
+        create_news(player, 'Cannot proceed: there is a better buy/sell offer available.')
         return
+    maker = [p for p in group.get_players() if p.id_in_group == maker_id][0]
+    fill_offer(player, maker, book, limit_entry, transaction_volume)
+
+
+def fill_offer(player: Player, maker: Player, book, limit_entry, transaction_volume):
+    # this code is run at the market page, within the transaction() and sweep_order() functions, once a fill is checked.
+    # this function trades transaction_volume units of the offer of limit_entry between its maker and the taker player:
+    # it updates holdings, counters, the Limit entry and the order book, and creates the Transaction and Order entries.
+    group = player.group
+    period = group.round_number
+    offer_id = int(limit_entry.offerID)
+    taker_id = player.id_in_group
+    maker_id = maker.id_in_group
+    is_bid = limit_entry.isBid
+    price = float(limit_entry.price)
+    remaining_volume = int(limit_entry.remainingVolume)
+    limit_volume = int(limit_entry.limitVolume)
+    is_active = limit_entry.isActive and transaction_volume < remaining_volume
+    best_ask_before = book.best_ask()
+    best_bid_before = book.best_bid()
     offer_time = round(float(limit_entry.offerTime), C.decimals)
-    players = group.get_players()
-    maker = [p for p in players if p.id_in_group == maker_id][0]
     if is_bid:
         [buyer, seller] = [maker, player]
         maker.cashOffered -= transaction_volume * price
@@ -1309,14 +1555,8 @@ def transaction(player: Player, data):
         group.marketBuyVolume += transaction_volume
         seller_id = maker.id_in_group
         buyer_id = seller.id_in_group
-    transaction_id = player.subsession.transactionID + 1
-    player.subsession.transactionID += 1
-    while len(Transaction.filter(group=group, offerID=transaction_id)) > 0:  # to prevent duplicates in transactionID
-        transaction_id += 1
-    order_id = player.subsession.orderID + 1
-    player.subsession.orderID += 1
-    while len(Order.filter(group=group, offerID=order_id)) > 0:  # to prevent duplicates in orderID
-        order_id += 1
+    transaction_id = next_id(group, 'transactionID')
+    order_id = next_id(group, 'orderID')
     transaction_time = round(float(time.time() - group.marketStartTime), C.decimals)
     limit_entry.transactedVolume += transaction_volume
     limit_entry.isActive = is_active
@@ -1338,9 +1578,9 @@ def transaction(player: Player, data):
     player.marketOrderVolume += transaction_volume
     group.transactions += 1
     group.transactedVolume += transaction_volume
-    limitOffers = Limit.filter(group=group)
-    best_bid_after = max([offer.price for offer in limitOffers if offer.isActive and offer.isBid] or [-1])
-    best_ask_after = min([offer.price for offer in limitOffers if offer.isActive and not offer.isBid] or [-1])
+    book.fill(offer_id, transaction_volume)
+    best_bid_after = book.best_bid() or -1
+    best_ask_after = book.best_ask() or -1
     if not best_ask_before:
         best_ask_before = -1
     if not best_bid_before:
@@ -1380,6 +1620,7 @@ def transaction(player: Player, data):
         buyerID=buyer_id,
         limitVolume=limit_volume,
         price=price,
+        transactionVolume=transaction_volume,
         transactedVolume=transacted_volume,
         remainingVolume=remaining_volume - transaction_volume,
         amount=limit_volume * price,
@@ -1393,6 +1634,50 @@ def transaction(player: Player, data):
         bestAskAfter=best_ask_after,
         bestBidAfter=best_bid_after,
     )
+    record_trade(group, [price, transaction_volume, transaction_time, seller_id], maker_id, taker_id)
+
+def sweep_order(player: Player, data):
+    # this code is run at the market page, within the transaction() function, for market orders without an offerID.
+    # this function buys (isBid=1) or sells (isBid=0) transactionVolume units at the best offers of the other side in
+    # one message, walking the book in price-time priority up to an optional worst price (limitPrice).
+    # The book is walked once to find all fills (see sweep_fills()) before any of them is written, and every fill is
+    # recorded as a market order on one offer; volume without a matching offer is not placed.
+    if player.isObserver:
+        create_news(player, 'Cannot proceed: you are an observer who cannot accept a bid/ask.')
+        return
+    try:
+        is_bid = int(data['isBid']) == 1
+        volume = int(data['transactionVolume'])
+        worst_price = round(float(data['limitPrice']), C.decimals) if data.get('limitPrice') else None
+    except (KeyError, TypeError, ValueError):
+        create_news(player, 'Cannot proceed: misspecified volume or price.')
+        return
+    if volume <= 0 or (worst_price is not None and worst_price <= 0):
+        create_news(player, 'Cannot proceed: misspecified volume or price.')
+        return
+    if worst_price is None:
+        worst_price = float('inf') if is_bid else 0
+    group = player.group
+    book = order_book(group)
+    if is_bid:
+        budget = player.cashHolding + player.capLong - player.cashOffered
+    else:
+        budget = player.assetsHolding + player.capShort - player.assetsOffered
+    fills, remaining, rejected = sweep_fills(book, is_bid, worst_price, volume, player.id_in_group, budget)
+    if fills:
+        filled = {entry[2] for entry, _ in fills}
+        limit_entries = {}
+        for limit_entry in Limit.filter(group=group, isActive=True):
+            if limit_entry.offerID in filled:
+                limit_entries.setdefault(limit_entry.offerID, limit_entry)  # use first entry if duplicates exist
+        players = {p.id_in_group: p for p in group.get_players()}
+        for entry, transaction_volume in fills:
+            fill_offer(player, players[entry[3]], book, limit_entries[entry[2]], transaction_volume)
+    if rejected:
+        create_news(player, f'Cannot proceed: insufficient {"cash" if is_bid else "assets"} available.')
+    elif remaining:
+        create_news(player, f'{volume - remaining} of {volume} units traded: there are no further buy/sell offers at an acceptable price.')
+
 
 def buy_good(player: Player, data):
     good = data.get('good')
@@ -1400,61 +1685,31 @@ def buy_good(player: Player, data):
     try:
         qty = int(qty_raw)
     except (ValueError, TypeError):
-        News.create(
-            player=player,
-            playerID=player.id_in_group,
-            group=player.group,
-            Period=player.group.round_number,
-            msg='Cannot proceed: invalid quantity.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+        create_news(player, 'Cannot proceed: invalid quantity.')
         return dict()
 
     # Add validation for invalid quantities
     if qty <= 0:
-        News.create(
-            player=player,
-            playerID=player.id_in_group,
-            group=player.group,
-            Period=player.group.round_number,
-            msg='Cannot proceed: quantity must be positive.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+        create_news(player, 'Cannot proceed: quantity must be positive.')
         return dict()
 
     # Prices and asset costs from constants
     try:
         price = get_good_money_price(good)
-        asset_cost = get_good_carbon_price(good)
+        total_price, total_assets = rules.purchase_cost(MARKET, good, qty)
     except ValueError:
-        News.create(
-            player=player,
-            playerID=player.id_in_group,
-            group=player.group,
-            Period=player.group.round_number,
-            msg='Cannot proceed: invalid good.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+        create_news(player, 'Cannot proceed: invalid good.')
         return dict()
 
     # Check if player can afford
     # Must account for locked resources in open bids/asks:
     # - cashOffered: cash locked in open bids (offers to buy assets)
     # - assetsOffered: assets locked in open asks (offers to sell assets)
-    total_price = price * qty
-    total_assets = asset_cost * qty
     available_cash = player.cashHolding - player.cashOffered
     available_assets = player.assetsHolding - player.assetsOffered
     
-    if available_cash < total_price or available_assets < total_assets:
-        News.create(
-            player=player,
-            playerID=player.id_in_group,
-            group=player.group,
-            Period=player.group.round_number,
-            msg='Cannot proceed: insufficient funds or assets. Remember: your open buy/sell offers lock some of your resources. You can cancel them to free up resources.',
-            msgTime=round(float(time.time() - player.group.marketStartTime), C.decimals)
-        )
+    if not rules.affordable((total_price, total_assets), available_cash, available_assets):
+        create_news(player, 'Cannot proceed: insufficient funds or assets. Remember: your open buy/sell offers lock some of your resources. You can cancel them to free up resources.')
         return dict()
 
     # Update player holdings (only if they can afford it)
@@ -1662,6 +1917,7 @@ class WaitingMarket(WaitPage):
         # Initialize best bid/ask fields at start of each round (needed for BidAsks data export)
         group.bestBid = None
         group.bestAsk = None
+        discard_market_state(group)  # start the round with an empty book
 
 
 class Market(Page):
@@ -1712,6 +1968,12 @@ class Market(Page):
             goodB_carbon_price=C.GOOD_B_CARBON_PRICE,
         )
 
+    @staticmethod
+    def before_next_page(player: Player, timeout_happened):
+        # the first participant leaving the market writes the group's buffered BidAsks observations, such that they
+        # are not lost if the server restarts before the results wait page.
+        flush_bid_asks(player.group)
+
 class ResultsWaitPage(WaitPage):
     @staticmethod
     def get_timeout_seconds(player: Player):
@@ -1725,6 +1987,8 @@ class ResultsWaitPage(WaitPage):
 
     @staticmethod
     def after_all_players_arrive(group: Group):
+        flush_bid_asks(group)
+        discard_market_state(group)  # the market is closed, the Limit table keeps the record
         # Only process participating players
         players = [p for p in group.get_players() if p.isParticipating == 1]
         for p in players:
@@ -1732,16 +1996,19 @@ class ResultsWaitPage(WaitPage):
             p.unused_assets_endofround = p.assetsHolding
             
             calc_period_profits(player=p)
+        update_score_matrix(group, players)
+        set_deadlines(players, 'Results', C.results_time)  # the same deadline for the whole group
         
         # Calculate final profit and determine winners at group level (only in final round)
         if group.round_number == C.NUM_ROUNDS:
             calc_final_profit(group=group)
+            dump_metrics(group.session)
 
 
 class Results(Page):
     @staticmethod
     def get_timeout_seconds(player: Player):
-        return persistent_timeout(player, 'Results', 45)
+        return persistent_timeout(player, 'Results', C.results_time)
     
     @staticmethod
     def is_displayed(player: Player):
@@ -1828,43 +2095,36 @@ class FinalResults(Page):
         # Mark participant as finished when they reach FinalResults page
         # Set this in vars_for_template since before_next_page isn't called on the last page
         player.participant.finished = True
-        # Get trading rounds for selected round lookup
-        trading_rounds = [p for p in player.in_all_rounds() if p.round_number > C.num_trial_rounds]
+        # Score Change % of all group members in all trading rounds, see update_score_matrix()
+        matrix = score_matrix(player.group)
+        group_ids = [p.id_in_group for p in player.group.get_players() if p.isParticipating == 1]
+        own_scores = matrix.get(player.id_in_group, [])
         selected_round_index = player.selectedRound - 1  # Convert to 0-based index
         
-        # Calculate carbon impact for selected round (destruction group only)
+        # Calculate carbon impact for selected round (destruction group only), reading only that round's row
         selected_round_carbon_impact = None
-        if player.framing == 'destruction' and selected_round_index < len(trading_rounds):
-            selected_round_player = trading_rounds[selected_round_index]
-            if hasattr(selected_round_player, 'unused_assets_endofround'):
-                unused_credits = selected_round_player.unused_assets_endofround
-                co2_retired = unused_credits * C.CO2_PER_CREDIT
-                km_saved = co2_retired * C.KM_PER_KG_CO2
-                selected_round_carbon_impact = {
-                    'unused_credits': unused_credits,
-                    'co2_retired': round(co2_retired, 1),
-                    'km_saved': round(km_saved, 1)
-                }
-        
-        # Get all players in the same group (for comparing Score Changes)
-        group_players = [p for p in player.group.get_players() if p.isParticipating == 1]
+        if player.framing == 'destruction' and selected_round_index < len(own_scores):
+            selected_round_player = player.in_round(C.num_trial_rounds + player.selectedRound)
+            unused_credits = selected_round_player.unused_assets_endofround
+            co2_retired = unused_credits * C.CO2_PER_CREDIT
+            km_saved = co2_retired * C.KM_PER_KG_CO2
+            selected_round_carbon_impact = {
+                'unused_credits': unused_credits,
+                'co2_retired': round(co2_retired, 1),
+                'km_saved': round(km_saved, 1)
+            }
         
         # Get player's score change and max score change in the selected round
         player_score_change = None
         max_score_change = None
         was_tied_but_not_selected = False
         
-        if selected_round_index < len(trading_rounds):
-            selected_round_player = trading_rounds[selected_round_index]
-            player_score_change = selected_round_player.utilityChangePercent
+        if selected_round_index < len(own_scores):
+            player_score_change = own_scores[selected_round_index]
             
             # Get all group members' scores for the selected round
-            all_scores = []
-            for group_player in group_players:
-                for rp in group_player.in_all_rounds():
-                    if rp.round_number == selected_round_player.round_number:
-                        all_scores.append(rp.utilityChangePercent)
-                        break
+            all_scores = [matrix[i][selected_round_index] for i in group_ids
+                          if selected_round_index < len(matrix.get(i, []))]
             
             if all_scores:
                 max_score_change = max(all_scores)
@@ -1872,42 +2132,22 @@ class FinalResults(Page):
                 if player_score_change == max_score_change and not player.isWinner:
                     was_tied_but_not_selected = True
         
-        # Generate period data with Score Change % and carbon credit info for destruction group
+        # Generate period data with Score Change % of the player and of the other group members
         periodPayoff = []
         
-        for p in player.in_all_rounds():
-            if p.round_number > C.num_trial_rounds:
-                # Round data: [Round number, Score Change %]
-                round_data = [p.round_number - C.num_trial_rounds, round(p.utilityChangePercent, C.decimals)]
-                
-                # Collect Score Changes of other group members for this round
-                other_players_scores = []
-                for other_player in group_players:
-                    if other_player.id != player.id:  # Exclude current player
-                        # Find the other player's round data for this round number
-                        other_round_player = None
-                        for rp in other_player.in_all_rounds():
-                            if rp.round_number == p.round_number:
-                                other_round_player = rp
-                                break
-                        
-                        if other_round_player:
-                            other_score = round(other_round_player.utilityChangePercent, C.decimals)
-                            other_players_scores.append(f"{other_score}")
-                
-                # Format as comma-separated list
-                other_scores_str = ", ".join(other_players_scores) if other_players_scores else "-"
-                round_data.append(other_scores_str)
-                
-                # Add carbon credit info for destruction group
-                if player.framing == 'destruction' and hasattr(p, 'unused_assets_endofround'):
-                    unused_credits = p.unused_assets_endofround
-                    co2_retired = unused_credits * C.CO2_PER_CREDIT
-                    km_saved = co2_retired * C.KM_PER_KG_CO2
-                    
-                    round_data.extend([unused_credits, round(co2_retired, 1), round(km_saved, 1)])
-                
-                periodPayoff.append(round_data)
+        for index, score in enumerate(own_scores):
+            # Round data: [Round number, Score Change %]
+            round_data = [index + 1, round(score, C.decimals)]
+            
+            # Collect Score Changes of other group members for this round
+            other_players_scores = [f"{round(matrix[i][index], C.decimals)}" for i in group_ids
+                                    if i != player.id_in_group and index < len(matrix.get(i, []))]
+            
+            # Format as comma-separated list
+            other_scores_str = ", ".join(other_players_scores) if other_players_scores else "-"
+            round_data.append(other_scores_str)
+            
+            periodPayoff.append(round_data)
         
         return dict(
             payoff=cu(round(player.finalPayoff, 2)),
@@ -1921,6 +2161,65 @@ class FinalResults(Page):
         )
 
 
+# Waiting rooms of the group formation, keyed by subsession id. Like the order books they are kept in memory; after a
+# server restart a waiting room is restored once from the participant flags and waiting_since times.
+_waiting_rooms = {}
+_waiting_rooms_lock = threading.Lock()
+
+
+def is_waiting(participant):
+    # this function tells whether a participant waits for a group (passed comprehension, not on EarlyEnd, not grouped).
+    return (not participant.vars.get('no_more_pages', False) and
+            participant.vars.get('comp_passed', False) and
+            participant.vars.get('waiting_for_group', False) and
+            'cash_endowment' not in participant.vars)
+
+
+def waiting_room(subsession: Subsession):
+    # this code is run at the FormTradingGroups page.
+    # this function returns the subsession's WaitingRoom of players (by id_in_subsession) in order of arrival.
+    room = _waiting_rooms.get(subsession.id)
+    if room is None:
+        with _waiting_rooms_lock:
+            room = _waiting_rooms.get(subsession.id)
+            if room is None:
+                room = WaitingRoom()
+                now = time.time()
+                waiting = [p for p in subsession.get_players() if is_waiting(p.participant)]
+                for p in sorted(waiting, key=lambda p: (p.participant.vars.get('waiting_since', now), p.id_in_subsession)):
+                    room.arrive(p.id_in_subsession, p.participant.vars.get('waiting_since', now))
+                _waiting_rooms[subsession.id] = room
+    return room
+
+
+def mark_insufficient_players(player: Player):
+    # this code is run at the FormTradingGroups page when the waiting time ran out.
+    # this function sends a player who could not be grouped to EarlyEnd and removes them from the waiting room.
+    player.isParticipating = 0
+    player.participant.vars['isParticipating'] = 0
+    player.insufficient_players_timeout = True  # Save to Player model for data export
+    player.participant.vars['insufficient_players_timeout'] = True
+    player.participant.vars['waiting_for_group'] = False
+    player.participant.vars['no_more_pages'] = True  # Critical: prevent showing FormTradingGroups again
+    waiting_room(player.subsession).leave(player.id_in_subsession)
+
+
+def release_expired(subsession: Subsession):
+    # this code is run at the FormTradingGroups page and in group_by_arrival_time_method.
+    # this function sends the players whose waiting time ran out to EarlyEnd if too few are waiting to form a group.
+    # The waiting room is ordered by deadline, so a request before the next deadline only compares two numbers; when it
+    # has passed, only the expired players are loaded, in one query, and released together. The waiting pages reload
+    # when the earliest deadline passes (see FormTradingGroups.vars_for_template), which runs this function on time.
+    room = waiting_room(subsession)
+    now = time.time()
+    deadline = room.next_deadline(C.group_formation_timeout)
+    if deadline is None or now < deadline or len(room) >= C.PLAYERS_PER_GROUP:
+        return
+    expired = room.expire(now, C.group_formation_timeout)
+    for p in subsession.player_set.filter(Player.id_in_subsession.in_(expired)):
+        mark_insufficient_players(p)
+
+
 def group_by_arrival_time_method(subsession: Subsession, waiting_players):
     """
     Called by oTree when group_by_arrival_time = True on FormTradingGroups.
@@ -1928,85 +2227,25 @@ def group_by_arrival_time_method(subsession: Subsession, waiting_players):
     This function must be at module level (not inside a class).
     
     Note: Players who reach this page should all be eligible (failed players are on EarlyEnd).
-    Also handles timeout: if a player has been waiting > 15 minutes and can't form a group, mark them for EarlyEnd.
+    Groups are formed first come, first served from the waiting room; waiting_players (connected players on this page,
+    as determined by oTree) only decides who can be grouped right now.
+    Also handles timeout: players who have been waiting > 25 minutes and can't form a group are marked for EarlyEnd.
     """
     if subsession.round_number != 1:
         return None  # Use default grouping for other rounds
     
-    # Get ALL players in the subsession (not just waiting_players) because we're using 2-app approach
-    all_players = subsession.get_players()
-    
-    
-    # Check for timeout: if any player has been waiting > 25 minutes and can't form a group, mark them for EarlyEnd
-    session = subsession.session
-    timeout_key = 'form_trading_groups_first_arrival_time'
-    timeout_duration = 1500  # 25 minutes
-    
-    if timeout_key in session.vars:
-        elapsed = time.time() - session.vars[timeout_key]
-        if elapsed >= timeout_duration:
-            # Timeout reached - check if there are enough players to form a group
-            eligible_before_timeout = [p for p in all_players 
-                                     if not p.participant.vars.get('no_more_pages', False) and
-                                        p.participant.vars.get('comp_passed', False) and
-                                        p.participant.vars.get('waiting_for_group', False) and
-                                        'cash_endowment' not in p.participant.vars]
-            
-            if len(eligible_before_timeout) < C.PLAYERS_PER_GROUP:
-                # Not enough players - mark all waiting players for EarlyEnd
-                for p in eligible_before_timeout:
-                    p.isParticipating = 0
-                    p.participant.vars['isParticipating'] = 0
-                    p.insufficient_players_timeout = True  # Save to Player model for data export
-                    p.participant.vars['insufficient_players_timeout'] = True
-                    p.participant.vars['waiting_for_group'] = False
-                    p.participant.vars['no_more_pages'] = True
-                # Clear timeout key
-                if timeout_key in session.vars:
-                    del session.vars[timeout_key]
-                # Return None to prevent grouping (players will go to EarlyEnd)
-                return None
-    
-    # Check each player's status
-    for p in all_players:
-        waiting_flag = p.participant.vars.get('waiting_for_group', False)
-        comp_passed = p.participant.vars.get('comp_passed', False)
-        is_participating = p.isParticipating == 1
-        has_cash = 'cash_endowment' in p.participant.vars
-        no_more_pages = p.participant.vars.get('no_more_pages', False)
-    
-    # Filter to only eligible players who have passed comprehension and are waiting
-    # Players who reach this page should have comp_passed=True, but double-check
-    eligible = [p for p in all_players 
-              if not p.participant.vars.get('no_more_pages', False) and  # Not on EarlyEnd
-                 p.participant.vars.get('comp_passed', False) and  # Must have passed comprehension
-                 p.participant.vars.get('waiting_for_group', False) and  # Must be waiting for group
-                 'cash_endowment' not in p.participant.vars]  # Not already grouped
-    
-    # Get the required group size from constants
+    room = waiting_room(subsession)
     required_size = C.PLAYERS_PER_GROUP
     
+    # Check for timeout: players whose waiting time ran out go to EarlyEnd if there are not enough players for a group
+    release_expired(subsession)
     
-    # If we have enough players, return the first group of required_size
-    if len(eligible) >= required_size:
-        # Use a flag to prevent forming the same group multiple times
-        # Sort by id to ensure consistent grouping
-        eligible_sorted = sorted(eligible, key=lambda p: p.id_in_subsession)
-        new_group = eligible_sorted[:required_size]
-        
-        # Create a unique key for this group
-        group_key = tuple(sorted([p.id_in_subsession for p in new_group]))
-        formation_key = f'_group_formed_{group_key}'
-        
-        if not subsession.session.vars.get(formation_key, False):
-            # Mark that we're forming this group
-            subsession.session.vars[formation_key] = True
-            return new_group
-        else:
-            return None
-    
-    # Not enough players yet, return None to keep waiting
-    return None
+    # Take the first players of the waiting room who are on the page now; the group leaves the room, so it is formed once
+    present = {p.id_in_subsession: p for p in waiting_players}
+    keys = room.take(required_size, present)
+    if keys is None:
+        return None  # Not enough players yet, keep waiting
+    return [present[k] for k in keys]
 
 
 class FormTradingGroups(WaitPage):
@@ -2130,12 +2369,6 @@ class FormTradingGroups(WaitPage):
                 # count_participants() already sets group.numParticipants, so we don't need to set it again
                 # group.numParticipants = participating_count
                 
-                # Reset timeout timer for the next group - give them a fresh 30 minutes
-                timeout_key = 'form_trading_groups_first_arrival_time'
-                session = group.subsession.session
-                if timeout_key in session.vars:
-                    del session.vars[timeout_key]
-                
                 for p in players:
                     if p.isParticipating == 1:
                         pass  # Player initialization handled elsewhere
@@ -2143,8 +2376,10 @@ class FormTradingGroups(WaitPage):
                         initiate_player(player=p)
                 
                 # Mark players as no longer waiting
+                room = waiting_room(group.subsession)
                 for p in players:
                     p.participant.vars['waiting_for_group'] = False
+                    room.leave(p.id_in_subsession)
             else:
                 # No treatment found for first player - this shouldn't happen
                 pass
@@ -2154,8 +2389,8 @@ class FormTradingGroups(WaitPage):
     
     @staticmethod
     def get_timeout_seconds(player: Player):
-        # Timeout after 25 minutes (1500 seconds) - send to EarlyEnd
-        return 1500
+        # Timeout after 25 minutes - send to EarlyEnd
+        return C.group_formation_timeout
     
     @staticmethod
     def is_displayed(player: Player):
@@ -2184,6 +2419,8 @@ class FormTradingGroups(WaitPage):
         # Mark that this player is available for grouping
         # (This is set in preparation app's ComprehensionPassed, but set it here too as backup)
         player.participant.vars['waiting_for_group'] = True
+        since = player.participant.vars.setdefault('waiting_since', time.time())  # start of this player's waiting time
+        waiting_room(player.subsession).arrive(player.id_in_subsession, since)
         
         return True
     
@@ -2197,44 +2434,17 @@ class FormTradingGroups(WaitPage):
             return {}
         
         subsession = player.subsession
-        session = subsession.session
         
         # Use PLAYERS_PER_GROUP from constants (not hardcoded)
         required_group_size = C.PLAYERS_PER_GROUP
-        timeout_key = 'form_trading_groups_first_arrival_time'  # Tracks when first eligible player arrived for timeout calculation
-        timeout_duration = 1500  # 25 minutes
-        
-        # Get all eligible players who are waiting (simplified - players who reach this page should be eligible)
-        # Include the current player in the count
-        # Only count players who are actually waiting (have waiting_for_group=True and no cash_endowment)
-        waiting = [p for p in subsession.get_players() 
-                  if not p.participant.vars.get('no_more_pages', False) and
-                     p.participant.vars.get('waiting_for_group', False) and
-                     'cash_endowment' not in p.participant.vars]
-        
         
-        # Set first arrival time if this is the first eligible player
-        if waiting and timeout_key not in session.vars:
-            session.vars[timeout_key] = time.time()
+        # Players who are waiting, in order of arrival (the current player is included)
+        room = waiting_room(subsession)
         
-        # Check if timeout has been reached
-        timeout_reached = False
-        if timeout_key in session.vars:
-            elapsed = time.time() - session.vars[timeout_key]
-            if elapsed >= timeout_duration:
-                timeout_reached = True
-        
-        # Handle timeout: mark all waiting players for EarlyEnd if they can't form a group
-        if timeout_reached and len(waiting) < required_group_size:
-            for p in waiting:
-                p.isParticipating = 0
-                p.participant.vars['isParticipating'] = 0
-                p.insufficient_players_timeout = True  # Save to Player model for data export
-                p.participant.vars['insufficient_players_timeout'] = True
-                p.participant.vars['waiting_for_group'] = False
-                p.participant.vars['no_more_pages'] = True
-            if timeout_key in session.vars:
-                del session.vars[timeout_key]
+        # Handle timeout: players whose waiting time ran out go to EarlyEnd if they can't form a group
+        release_expired(subsession)
+        timeout_reached = player.participant.vars.get('insufficient_players_timeout', False)
+        if timeout_reached:
             return {
                 'eligible_count': 0,
                 'players_needed': 0,
@@ -2243,34 +2453,24 @@ class FormTradingGroups(WaitPage):
                 'timeout_reached': True,
                 'insufficient_players': True,
                 'time_remaining': None,
+                'release_ms': None,
             }
         
         # Calculate display values
         # Show how many players are needed to complete the NEXT group that will form
-        # This is based on how many players are currently waiting (not yet in a group)
-        # The current player is included in 'waiting'
-        if len(waiting) == 0:
-            # Shouldn't happen, but fallback
-            needed = required_group_size
-        else:
-            # Calculate how many players are needed for the next group
-            # If there are N waiting players, they will form groups of size required_group_size
-            # The remainder tells us how many are in the "incomplete" next group
-            remaining_in_next_group = len(waiting) % required_group_size
-            if remaining_in_next_group == 0:
-                # All waiting players can form complete groups, so the next group needs required_group_size players
-                needed = required_group_size
-            else:
-                # There's an incomplete group forming - show how many more it needs
-                # Example: if 1 person is waiting and group_size=2, remaining=1, needed=2-1=1
-                needed = required_group_size - remaining_in_next_group
+        # Example: if 1 person is waiting and group_size=2, needed=2-1=1; complete groups leave a full group to fill
+        needed = room.needed(required_group_size)
         
-        # Check if timeout is approaching (for display purposes)
+        # Time left until this player's own deadline
         time_remaining = None
-        if timeout_key in session.vars:
-            elapsed = time.time() - session.vars[timeout_key]
-            time_remaining = max(0, timeout_duration - elapsed)
-            time_remaining = int(time_remaining)
+        deadline = room.deadline(player.id_in_subsession, C.group_formation_timeout)
+        if deadline is not None:
+            time_remaining = int(max(0, deadline - time.time()))
+        # Milliseconds until the earliest deadline in the waiting room, when the page reloads to release the expired players
+        release_ms = None
+        next_deadline = room.next_deadline(C.group_formation_timeout)
+        if next_deadline is not None:
+            release_ms = max(0, int(1000 * (next_deadline - time.time()))) + 1
         
         # Check if this player was just assigned to a group
         player_has_cash = 'cash_endowment' in player.participant.vars
@@ -2279,11 +2479,12 @@ class FormTradingGroups(WaitPage):
             player.participant.vars['waiting_for_group'] = False
         
         return {
-            'eligible_count': len(waiting), 
+            'eligible_count': len(room), 
             'players_needed': needed, 
             'group_size': required_group_size,
             'player_has_cash_endowment': player_has_cash,
             'time_remaining': time_remaining,
+            'release_ms': release_ms,
             'timeout_reached': timeout_reached,
             'insufficient_players': False
         }
@@ -2294,12 +2495,7 @@ class FormTradingGroups(WaitPage):
         if timeout_happened:
             # Check if player couldn't form a group (still waiting)
             if 'cash_endowment' not in player.participant.vars:
-                player.isParticipating = 0
-                player.participant.vars['isParticipating'] = 0
-                player.insufficient_players_timeout = True  # Save to Player model for data export
-                player.participant.vars['insufficient_players_timeout'] = True
-                player.participant.vars['waiting_for_group'] = False
-                player.participant.vars['no_more_pages'] = True  # Critical: prevent showing FormTradingGroups again
+                mark_insufficient_players(player)
 
 
 class TreatmentAssignment(Page):
@@ -2352,116 +2548,96 @@ class TreatmentAssignment(Page):
     def before_next_page(player: Player, timeout_happened):
         """Preserve groups from round 1 for rounds > 1"""
         if player.round_number > 1:
-            subsession = player.subsession
-            round_1_player = player.in_round(1)
-            
             # Copy group structure from round 1 (only do this once per subsession)
-            init_key = f'_round_{subsession.round_number}_initialized'
-            if not subsession.session.vars.get(init_key, False):
+            subsession = player.subsession
+            if not subsession.groupedLikeRound1:
                 subsession.group_like_round(1)
-                subsession.session.vars[init_key] = True
-            
-            # Get player's current group
-            current_group = player.group
-            if not current_group:
-                return
-            
-            # Copy isParticipating from round 1
-            if round_1_player:
-                player.isParticipating = round_1_player.isParticipating
-                player.participant.vars['isParticipating'] = round_1_player.isParticipating
-            
-            # Find corresponding group from round 1 by matching players
-            round_1_group = None
-            current_group_participant_ids = {p.participant.id for p in current_group.get_players()}
-            for r1_group in subsession.in_round(1).get_groups():
-                r1_group_participant_ids = {p.participant.id for p in r1_group.get_players()}
-                if current_group_participant_ids == r1_group_participant_ids:
-                    round_1_group = r1_group
-                    break
-            
-            # Copy treatment/framing/endowment_type from round 1
-            if round_1_player:
-                treatment_val = round_1_player.participant.vars.get('treatment')
-                framing_val = round_1_player.participant.vars.get('framing')
-                endowment_type_val = round_1_player.participant.vars.get('endowment_type')
-                
-                if treatment_val:
-                    player.treatment = treatment_val
-                    current_group.treatment = treatment_val
-                if framing_val:
-                    player.framing = framing_val
-                    current_group.framing = framing_val
-                if endowment_type_val:
-                    player.endowment_type = endowment_type_val
-                    current_group.endowment_type = endowment_type_val
-            
-            # Copy group-level fields from round 1
-            if round_1_group:
-                if round_1_group.treatment:
-                    current_group.treatment = round_1_group.treatment
-                if round_1_group.framing:
-                    current_group.framing = round_1_group.framing
-                if round_1_group.endowment_type:
-                    current_group.endowment_type = round_1_group.endowment_type
-                if round_1_group.gini_coefficient is not None:
-                    current_group.gini_coefficient = round_1_group.gini_coefficient
-                if round_1_group.group_size:
-                    current_group.group_size = round_1_group.group_size
-                else:
-                    # Fallback to PLAYERS_PER_GROUP if group_size not set in round 1
-                    current_group.group_size = C.PLAYERS_PER_GROUP
-                if round_1_group.numParticipants:
-                    current_group.numParticipants = round_1_group.numParticipants
-            
-            # Copy cash endowment, good_preference, and all player values from round 1
-            if round_1_player:
-                # Copy cash_endowment from participant.vars
-                if 'cash_endowment' in round_1_player.participant.vars:
-                    player.participant.vars['cash_endowment'] = round_1_player.participant.vars['cash_endowment']
-                
-                # Copy good_preference
-                if round_1_player.field_maybe_none('good_preference'):
-                    good_pref = round_1_player.field_maybe_none('good_preference')
-                    player.good_preference = good_pref
-                    player.participant.vars['good_preference'] = good_pref
-                
-                # Initialize group for this round (only once per group)
-                if round_1_group and player.isParticipating == 1:
-                    group_init_key = f'_group_{current_group.id}_round_{subsession.round_number}_initialized'
-                    if not subsession.session.vars.get(group_init_key, False):
-                        # Initialize group-level settings once
-                        if not current_group.field_maybe_none('randomisedTypes'):
-                            current_group.randomisedTypes = random_types(group=current_group)
-                            initiate_group(group=current_group)
-                        subsession.session.vars[group_init_key] = True
-                
-                # Initialize EACH participating player (runs for every player, not just once per group)
-                if round_1_player and player.isParticipating == 1:
-                    # Copy all financial values directly from Round 1
-                    player.initialCash = round_1_player.initialCash
-                    player.initialAssets = round_1_player.initialAssets
-                    player.cashHolding = round_1_player.initialCash  # Reset to initial cash
-                    player.assetsHolding = round_1_player.initialAssets  # Reset to initial assets
-                    player.allowShort = round_1_player.allowShort
-                    player.allowLong = round_1_player.allowLong
-                    player.capShort = round_1_player.capShort
-                    player.capLong = round_1_player.capLong
-                    
-                    # Reset locked resources (no open orders at start of new round)
-                    player.cashOffered = 0
-                    player.assetsOffered = 0
-                    
-                    # Reset goods quantities and utility
-                    player.goodA_qty = 0
-                    player.goodB_qty = 0
-                    player.goods_utility = calculate_goods_utility(player)
-                    player.overall_utility = player.goods_utility + player.cashHolding
-                    
-                    # Re-initialize player state (this will recalculate limits based on copied values)
-                    # Note: set_player reads from participant.vars['cash_endowment'], which we already copied
-                    set_player(player=player)
-                    initiate_player(player=player)
+                subsession.groupedLikeRound1 = True
+            # The first member of a group to leave this page initialises the group and all its players
+            if not player.group.carriedForward:
+                carry_forward(player)
+
+
+def carry_forward_group(group: Group, previous_group: Group):
+    # this code is run at the TreatmentAssignment page of rounds > 1, within carry_forward().
+    # this function copies the treatment and the group-level values of the previous round.
+    for field in ['treatment', 'framing', 'endowment_type']:
+        if getattr(previous_group, field):
+            setattr(group, field, getattr(previous_group, field))
+    if previous_group.gini_coefficient is not None:
+        group.gini_coefficient = previous_group.gini_coefficient
+    # Fallback to PLAYERS_PER_GROUP if group_size not set in round 1
+    group.group_size = previous_group.group_size or C.PLAYERS_PER_GROUP
+    if previous_group.numParticipants:
+        group.numParticipants = previous_group.numParticipants
+
+
+def carry_forward_player(player: Player, previous: Player):
+    # this code is run at the TreatmentAssignment page of rounds > 1, within carry_forward().
+    # this function copies treatment, preference and endowments of a participating player from the previous round
+    # and resets holdings, open orders and goods for the new market.
+    for field in ['treatment', 'framing', 'endowment_type']:
+        if player.participant.vars.get(field):
+            setattr(player, field, player.participant.vars[field])
+    good_pref = previous.field_maybe_none('good_preference')
+    if good_pref:
+        player.good_preference = good_pref
+        player.participant.vars['good_preference'] = good_pref
+    
+    # Copy all financial values directly from the previous round (equal to round 1)
+    player.initialCash = previous.initialCash
+    player.initialAssets = previous.initialAssets
+    player.cashHolding = previous.initialCash  # Reset to initial cash
+    player.assetsHolding = previous.initialAssets  # Reset to initial assets
+    player.allowShort = previous.allowShort
+    player.allowLong = previous.allowLong
+    player.capShort = previous.capShort
+    player.capLong = previous.capLong
+    
+    # Reset locked resources (no open orders at start of new round)
+    player.cashOffered = 0
+    player.assetsOffered = 0
+    
+    # Reset goods quantities and utility
+    player.goodA_qty = 0
+    player.goodB_qty = 0
+    player.goods_utility = calculate_goods_utility(player)
+    player.overall_utility = player.goods_utility + player.cashHolding
+
+
+def carry_forward(player: Player):
+    # this code is run at the TreatmentAssignment page of rounds > 1, when the first member of a group leaves the page.
+    # this function initialises the player's group and all its players from the previous round. Groups move through
+    # the rounds at their own pace, so only this group's players of the previous round are used, which have all
+    # finished that round. They are loaded once and matched through participant ids.
+    group = player.group
+    previous_group = player.in_round(player.round_number - 1).group
+    previous_players = {p.participant.id: p for p in previous_group.get_players()}
+    participating = []
+    for p in group.get_players():
+        previous = previous_players[p.participant.id]
+        p.isParticipating = previous.isParticipating
+        p.participant.vars['isParticipating'] = previous.isParticipating
+        if p.isParticipating == 1:
+            participating.append((p, previous))
+    group.carriedForward = True
+    if not participating:
+        return
+    
+    # Initialize group-level settings once
+    carry_forward_group(group, previous_group)
+    for p, previous in participating:
+        carry_forward_player(p, previous)
+    if not group.field_maybe_none('randomisedTypes'):
+        group.randomisedTypes = random_types(group=group)
+        initiate_group(group=group, previous_players=previous_players)
+    
+    # Re-initialize player state (this will recalculate limits based on copied values)
+    # Note: set_player reads from participant.vars['cash_endowment'], which is kept from round 1
+    for p, _ in participating:
+        set_player(player=p)
+        initiate_player(player=p)
+
 
 # Page sequence - preparation pages (Welcome, Privacy, Instructions, Comprehension) are now in preparation app
 # FormTradingGroups is the first page in Trading app (after preparation app completes)
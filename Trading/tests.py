@@ -1,44 +1,74 @@
 from otree.api import Bot, Submission
 import random
+import time
+from os import environ
+from unittest import mock
+from cda.loadtest import MESSAGE_MIX, LoadReport, Pacer, parse_mix, random_message
 from . import (
-    Welcome, Privacy, Instructions, ComprehensionCheck, ComprehensionFeedback,
-    ComprehensionPassed, EndOfTrialRounds, PreMarket, Market, Results,
-    SurveyDemographics, SurveyAttitudes, FinalResults, C
+    TreatmentAssignment, EndOfTrialRounds, PreMarket, Market, Results,
+    SurveyDemographics, SurveyAttitudes, FinalResults, C,
+    Limit, Order, Transaction, News, BidAsks, order_book, flush_bid_asks, create_news,
 )
 
+# Load test of the market page, configured by environment variables, e.g.
+# LOAD_MESSAGES=2000 LOAD_RATE=50 otree test PCT 120
+# runs 20 groups, each receiving 2000 messages at 50 messages per second.
+LOAD_MESSAGES = int(environ.get('LOAD_MESSAGES', 50))  # messages per group and round
+LOAD_RATE = float(environ.get('LOAD_RATE', 0))  # messages per second and group (0 = as fast as possible)
+LOAD_MIX = parse_mix(environ['LOAD_MIX']) if environ.get('LOAD_MIX') else MESSAGE_MIX  # e.g. limit_order=0.5,market_order=0.5
+LOAD_SEED = environ.get('LOAD_SEED')
+load_report = LoadReport()
+
+
+def call_live_method(method, group=None, **kwargs):
+    # this code is run by the bots when the first player of a group reaches the market page.
+    # this function sends random orders, cancellations, fills and good purchases through live_method() and prints
+    # latency percentiles, payload sizes and database rows written per message.
+    # The bots of oTree 6 pass the group (see requirements.txt); method only takes an id_in_group and cannot tell it.
+    if group is None:
+        raise RuntimeError('The market load test needs oTree 6, whose bots pass the group to call_live_method().')
+    rng = random.Random(f'{LOAD_SEED}-{group.id}') if LOAD_SEED else random.Random()
+    traders = [p.id_in_group for p in group.get_players() if p.isParticipating and not p.isObserver]
+    if not traders or not LOAD_MESSAGES:
+        return
+    for player_id in traders:
+        method(player_id, {'operationType': 'market_start', 'protocol': 'delta', 'encoding': 'compact'})
+    if len(traders) > 1:
+        check_rejected_fill(method, group, *traders[:2])
+    pacer = Pacer(LOAD_RATE)
+    for _ in range(LOAD_MESSAGES):
+        pacer.wait()
+        player_id = rng.choice(traders)
+        data = random_message(rng, LOAD_MIX, player_id, list(order_book(group).offers.values()))
+        start = time.perf_counter()
+        payload = method(player_id, data)
+        load_report.record(data['operationType'], time.perf_counter() - start, payload)
+    flush_bid_asks(group)
+    load_report.add_market(sum(len(model.filter(group=group)) for model in [Limit, Order, Transaction, News, BidAsks]))
+    print(load_report.format())
+
+
+def check_rejected_fill(method, group, maker, taker):
+    # this code is run by the bots before the load test of a group.
+    # this function checks that a limit order whose fill is rejected only reports the rejection: its remaining volume
+    # is neither placed nor reported as meeting an own offer.
+    rejection = 'Cannot proceed: insufficient assets available.'
+    method(maker, {'operationType': 'limit_order', 'isBid': 0, 'limitPrice': 5, 'limitVolume': 1})
+    with mock.patch(f'{__package__}.transaction', lambda player, data: create_news(player, rejection)):
+        method(taker, {'operationType': 'limit_order', 'isBid': 1, 'limitPrice': 5, 'limitVolume': 1})
+    news = [n.msg for n in News.filter(group=group) if n.playerID == taker]
+    assert news[-1:] == [rejection], news
+    assert not any(entry[3] == taker for entry in order_book(group).offers.values())
+    method(maker, {'operationType': 'cancel_all'})
+
 
 class PlayerBot(Bot):
     def play_round(self):
-        # Welcome, Privacy, Instructions, and ComprehensionCheck are only shown in round 1
-        if self.player.round_number == 1:
-            # Welcome page - just click next
-            yield Submission(Welcome, check_html=False)
-            
-            # Privacy page - consent
-            yield Submission(Privacy, {'consent': True}, check_html=False)
-            
-            # Instructions page - just click next
-            yield Submission(Instructions, check_html=False)
-            
-            # ComprehensionCheck - answer all questions correctly
-            comp_answers = {
-                'comp_q1': 'c',  # Total Score increases from 50 to 85
-                'comp_q2': 'a',  # Total Score decreases from 40 to 30
-                'comp_q3': 'c',  # They do not directly affect Total Score, but needed to buy goods
-                'comp_q4': 'b',  # Incorrect (they are transferred)
-                'comp_q5': 'c'   # All get base €1.81, highest in group gets bonus
-            }
-            
-            # Add comp_q6 for destruction group
-            if self.player.framing == 'destruction':
-                comp_answers['comp_q6'] = 'a'  # Correct - CO2 compensation
-            
-            # Submit comprehension check with correct answers (should pass on first try)
-            yield Submission(ComprehensionCheck, comp_answers, check_html=False)
-            
-            # After passing, ComprehensionPassed page is shown
-            yield Submission(ComprehensionPassed, check_html=False)
-        
+        # Welcome, Privacy, Instructions, and ComprehensionCheck are shown in the preparation app (see preparation/tests.py)
+        # TreatmentAssignment copies the groups of round 1 in later rounds
+        if self.player.round_number > 1:
+            yield Submission(TreatmentAssignment, check_html=False)
+
         # EndOfTrialRounds - click next (only shown in round 2, after trial round 1 completes)
         # Note: is_displayed checks round_number == C.num_trial_rounds + 1
         if self.player.round_number == 2:  # After trial round (round 1)
@@ -47,8 +77,7 @@ class PlayerBot(Bot):
         # PreMarket - click next
         yield Submission(PreMarket, check_html=False)
         
-        # Market page - wait for timeout (bots don't need to trade, just wait)
-        # The Market page will timeout automatically, so we just submit
+        # Market page - the group trades in call_live_method() before the bots submit the page
         yield Submission(Market, check_html=False)
         
         # Results - click next
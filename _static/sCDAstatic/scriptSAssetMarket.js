@@ -26,18 +26,122 @@
     });
 
 
+    // Local copy of the market state, set by snapshots and kept up to date by deltas from the server
+    let market = {bids: [], asks: [], trades: [], highcharts_series: [], news: []}
+    let lastSeq = undefined
+    let resyncing = false
+    let chartMaxPoints = undefined
+    let flushTimer = undefined
+
+
+    function applySnapshot(data) {
+        market.bids = data.bids
+        market.asks = data.asks
+        market.trades = data.trades
+        market.highcharts_series = data.highcharts_series
+        market.news = data.news
+        lastSeq = data.seq
+        chartMaxPoints = data.chart_max_points
+        resyncing = false
+    }
+
+
+    // Inserts an offer in price-time priority: bids by descending price, asks by ascending price, ties by offerID
+    function insertOffer(offers, row, is_bid) {
+        let i = offers.findIndex(e => (is_bid ? e[0] < row[0] : e[0] > row[0]) || (e[0] == row[0] && e[2] > row[2]))
+        if (i < 0) {
+            offers.push(row)
+        } else {
+            offers.splice(i, 0, row)
+        }
+    }
+
+
+    function applyDelta(data) {
+        for (let change of data.book || []) {
+            if (change[0] == 'add') {
+                insertOffer(change[1] ? market.bids : market.asks, change[2], change[1])
+            } else if (change[0] == 'remove') {
+                market.bids = market.bids.filter(e => e[2] != change[1])
+                market.asks = market.asks.filter(e => e[2] != change[1])
+            } else if (change[0] == 'update') {
+                market.bids.concat(market.asks).filter(e => e[2] == change[1]).forEach(e => e[1] = change[2])
+            }
+        }
+        if (data.trades) {
+            market.trades = data.trades.concat(market.trades)
+        }
+        if (data.chart) {
+            if (market.highcharts_series.length == 0) {
+                market.highcharts_series = [{'name': 'Trades', 'data': []}]
+            }
+            market.highcharts_series[0].data = market.highcharts_series[0].data.concat(data.chart)
+        }
+        if (data.news) {
+            market.news = data.news.concat(market.news)
+        }
+        lastSeq = data.seq
+        if (chartMaxPoints && market.highcharts_series[0] && market.highcharts_series[0].data.length > 2 * chartMaxPoints) {
+            // the chart has grown far beyond the resolution of the server, a new snapshot brings a downsampled chart
+            resyncing = true
+            market_start()
+        }
+    }
+
+
+    // The server merges the updates of participants who did not act; when changes are waiting, it says when to collect them
+    function scheduleFlush(ms) {
+        if (flushTimer !== undefined) {
+            return
+        }
+        flushTimer = setTimeout(function() {
+            flushTimer = undefined
+            liveSend({'operationType': 'flush'})
+        }, ms)
+    }
+
+
     function liveRecv(data) {
         
+        // updates in the compact encoding arrive as arrays
+        if (Array.isArray(data)) {
+            data = decodeUpdate(data)
+        }
+
         // sanitise
         if (data === undefined) {
             return
         }
+
+        if (data.pending) {
+            scheduleFlush(data.flush_ms)
+            return
+        }
+
+        if (data.seq !== undefined && !data.snapshot) {
+            // a delta must follow the last update without gap, otherwise the full market state is requested again
+            if (resyncing) {
+                return
+            }
+            if (lastSeq === undefined || data.seq != lastSeq + 1) {
+                resyncing = true
+                market_start()
+                return
+            }
+            applyDelta(data)
+        } else {
+            applySnapshot(data)
+        }
         
         // javascript destructuring assignment
-        let {bids, asks, trades, cashHolding, assetsHolding, highcharts_series, news} = data;
+        let {bids, asks, trades, highcharts_series, news} = market;
 
-        elCashHolding.html(cu(cashHolding))
-        elAssetsHolding.html(assetsHolding)
+        if (data.cashHolding !== undefined) {
+            elCashHolding.html(cu(data.cashHolding))
+        }
+        if (data.assetsHolding !== undefined) {
+            elAssetsHolding.html(data.assetsHolding)
+        }
 
         // value describes the offerID and data-value the makerID
         elBidsTableBody.html(bids.map(e => `<tr id='offerID${e[2]}' value=${e[2]} data-value=${e[3]} data-custom="1"><td value=${e[1]}>${e[1]} for </td><td value=${e[0]}>${cu(e[0])}</td></tr>`).join(''))
@@ -44,8 +44,78 @@
         }
     }
 
+    // Requests a full snapshot of the market; afterwards the server sends only changes (protocol 'delta'),
+    // all of them as positional arrays (encoding 'compact', see decodeUpdate())
     function market_start() {
-        liveSend({'operationType': 'market_start'})
+        liveSend({'operationType': 'market_start', 'protocol': 'delta', 'encoding': 'compact'})
+    }
+
+
+    // Field order and version of the compact encoding, as in cda/wire.py
+    const WIRE_VERSION = 1
+    const WIRE_FIELDS = ['snapshot', 'ticks', 'chart_max_points', 'bids', 'asks', 'book', 'trades', 'chart', 'news',
+        'cashHolding', 'assetsHolding', 'goodA_qty', 'goodB_qty', 'goods_utility', 'overall_utility', 'goods_trade']
+    const WIRE_TICK_FIELDS = ['cashHolding', 'goods_utility', 'overall_utility']
+    const WIRE_BOOK_OPS = ['add', 'remove', 'update']
+    let wireTicks = 1
+
+
+    // Restores an update sent as [version, seq, mask, values of the fields whose bit is set in mask]; prices, times,
+    // cash and utilities arrive as integer ticks. Returns undefined for other versions.
+    function decodeUpdate(message) {
+        if (message[0] != WIRE_VERSION) {
+            return undefined
+        }
+        let values = {}
+        let next = 3
+        WIRE_FIELDS.forEach((field, i) => {
+            if (message[2] & (1 << i)) {
+                values[field] = message[next++]
+            }
+        })
+        if (values.ticks !== undefined) {
+            wireTicks = values.ticks
+        }
+        let t = wireTicks
+        let data = {seq: message[1]}
+        for (let side of ['bids', 'asks']) {
+            if (values[side] !== undefined) {
+                data[side] = values[side].map(e => [e[0] / t, e[1], e[2], e[3]])
+            }
+        }
+        if (values.book !== undefined) {
+            data.book = values.book.map(c => c[0] == 0 ? ['add', c[1] == 1, [c[2] / t, c[3], c[4], c[5]]] : [WIRE_BOOK_OPS[c[0]]].concat(c.slice(1)))
+        }
+        if (values.trades !== undefined) {
+            data.trades = values.trades.map(e => [e[0] / t, e[1], e[2] / t, e[3]])
+        }
+        let flat = values.chart || []
+        let points = []
+        for (let i = 0; i < flat.length; i += 2) {
+            points.push({'x': flat[i] / t, 'y': flat[i + 1] / t, 'name': 'Trades'})
+        }
+        if (values.snapshot) {
+            data.snapshot = true
+            data.chart_max_points = values.chart_max_points
+            data.trades = data.trades || []
+            data.news = []
+            data.highcharts_series = points.length ? [{'name': 'Trades', 'data': points}] : []
+        } else if (points.length) {
+            data.chart = points
+        }
+        if (values.news !== undefined) {
+            data.news = values.news.map(n => [n[0], n[1] / t, my_id])
+        }
+        for (let field of ['cashHolding', 'assetsHolding', 'goodA_qty', 'goodB_qty', 'goods_utility', 'overall_utility']) {
+            if (values[field] !== undefined) {
+                data[field] = WIRE_TICK_FIELDS.includes(field) ? values[field] / t : values[field]
+            }
+        }
+        if (values.goods_trade !== undefined) {
+            [data.goods_trade_good, data.goods_trade_qty, data.goods_trade_price] = values.goods_trade
+            data.goods_trade_price /= t
+        }
+        return data
     }
 
 
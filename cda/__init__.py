@@ -0,0 +1,5 @@
+"""Framework-independent building blocks of the continuous double auction.
+
+The modules in this package do not import oTree, such that the same market rules can be used by the
+Trading app at run time and by offline tools (replays, simulations, exports) without a running oTree server.
+"""
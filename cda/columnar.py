@@ -0,0 +1,185 @@
+"""Columnar copies of the customised data download.
+
+oTree delivers the customised tables of the Trading app (Limits, Transactions, Orders, BidAsks, News, Inequality)
+as one CSV file with a header row per table. This module splits such a file into typed columns and writes one file
+per table, session and period, such that analyses do not need to parse mixed CSV values again:
+
+    python -m cda.columnar Trading_custom_export.csv export/ --format parquet
+
+creates, e.g., ``export/sessionID=abc123/Period=1/Transactions.parquet``. Parquet and Feather files need pyarrow;
+the ``npz`` format only needs NumPy. Integer columns that contain missing values are stored as floats in ``npz`` files.
+Empty cells and the -1 placeholder of a missing best bid or ask are stored as missing values.
+"""
+import argparse
+import csv
+import os
+from collections import defaultdict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+FORMATS = ['parquet', 'feather', 'npz']
+PARTITIONS = ['sessionID', 'Period']
+
+INT = 'int'
+FLOAT = 'float'
+BOOL = 'bool'
+STR = 'str'
+
+COLUMN_TYPES = dict(
+    offerID=INT, orderID=INT, transactionID=INT, group=INT, Period=INT, maker=INT, taker=INT,
+    limitVolume=INT, transactionVolume=INT, remainingVolume=INT, sellerID=INT, buyerID=INT, playerID=INT, numPlayers=INT,
+    isBid=BOOL, isActive=BOOL,
+    price=FLOAT, offerTime=FLOAT, transactionTime=FLOAT, orderTime=FLOAT, BATime=FLOAT, msgTime=FLOAT, bestAsk=FLOAT, bestBid=FLOAT,
+    bestAskBefore=FLOAT, bestBidBefore=FLOAT, bestAskAfter=FLOAT, bestBidAfter=FLOAT, gini=FLOAT, theil=FLOAT, atkinson=FLOAT,
+)
+MISSING_QUOTE = -1  # placeholder for a missing best bid or ask in the market tables
+QUOTE_COLUMNS = {'bestAsk', 'bestBid', 'bestAskBefore', 'bestBidBefore', 'bestAskAfter', 'bestBidAfter'}
+
+
+def read_tables(rows):
+    """
+    Split the rows of the customised data download into tables.
+
+    Args:
+        rows: Iterable of CSV rows, each table starting with a row whose first cell is 'TableName'
+
+    Yields:
+        tuple: (table name, header, list of rows) for each table
+    """
+    header, name, table = None, None, []
+    for row in rows:
+        if not row:
+            continue
+        if row[0] == 'TableName':
+            if table:
+                yield name, header, table
+            header, name, table = row, None, []
+        elif header is not None:
+            name = row[0]
+            table.append(row)
+    if table:
+        yield name, header, table
+
+
+def parse(value, column_type, column=None):
+    """Convert one CSV cell to its column type; empty cells (and placeholder quotes) become None."""
+    if value is None or value == '' or value == 'None':
+        return None
+    if column_type == INT:
+        return int(float(value))
+    if column_type == FLOAT:
+        value = float(value)
+        return None if column in QUOTE_COLUMNS and value == MISSING_QUOTE else value
+    if column_type == BOOL:
+        return value in ('True', 'true', '1', 1, True)
+    return str(value)
+
+
+def to_columns(header, rows):
+    """Return the typed columns of a table as a dict {column: list of values}, without the TableName column."""
+    columns = {}
+    for i, column in enumerate(header):
+        if column == 'TableName' or column in columns:
+            continue
+        column_type = COLUMN_TYPES.get(column, STR)
+        columns[column] = [parse(row[i] if i < len(row) else None, column_type, column) for row in rows]
+    return columns
+
+
+def partition(header, rows, keys=PARTITIONS):
+    """Group the rows of a table by the partition columns; returns {(value, ...): rows}."""
+    positions = [header.index(k) for k in keys if k in header]
+    parts = defaultdict(list)
+    for row in rows:
+        parts[tuple(row[i] for i in positions)].append(row)
+    return parts
+
+
+def _arrow_table(columns):
+    types = {INT: pa.int64(), FLOAT: pa.float64(), BOOL: pa.bool_(), STR: pa.string()}
+    return pa.table({c: pa.array(v, type=types[COLUMN_TYPES.get(c, STR)]) for c, v in columns.items()})
+
+
+def _numpy_arrays(columns):
+    arrays = {}
+    for c, values in columns.items():
+        column_type = COLUMN_TYPES.get(c, STR)
+        if column_type == STR:
+            arrays[c] = np.array(['' if v is None else v for v in values], dtype=str)
+        elif None in values:
+            arrays[c] = np.array([np.nan if v is None else v for v in values], dtype=float)
+        else:
+            arrays[c] = np.array(values, dtype={INT: np.int64, FLOAT: np.float64, BOOL: np.bool_}[column_type])
+    return arrays
+
+
+def write_columns(columns, path, fmt):
+    """Write typed columns to a Parquet, Feather or npz file."""
+    if fmt == 'npz':
+        if np is None:
+            raise ImportError('the npz format requires NumPy')
+        np.savez(path, **_numpy_arrays(columns))
+    else:
+        if pa is None:
+            raise ImportError(f'the {fmt} format requires pyarrow')
+        table = _arrow_table(columns)
+        if fmt == 'parquet':
+            pyarrow.parquet.write_table(table, path)
+        else:
+            pyarrow.feather.write_feather(table, path)
+
+
+def default_format():
+    return 'parquet' if pa is not None else 'npz'
+
+
+def export(rows, out_dir, fmt=None):
+    """
+    Write each table of the customised data download as one columnar file per session and period.
+
+    Args:
+        rows: Iterable of CSV rows of the customised data download
+        out_dir: Directory of the partitioned files
+        fmt: One of FORMATS; Parquet if pyarrow is installed, otherwise npz
+
+    Returns:
+        list: Paths of the written files
+    """
+    fmt = fmt or default_format()
+    if fmt not in FORMATS:
+        raise ValueError(f'unknown format {fmt}, use one of {FORMATS}')
+    paths = []
+    for name, header, table in read_tables(rows):
+        keys = [k for k in PARTITIONS if k in header]
+        for values, part in partition(header, table, keys).items():
+            directory = os.path.join(out_dir, *(f'{k}={v}' for k, v in zip(keys, values)))
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'{name}.{fmt}')
+            write_columns(to_columns(header, part), path, fmt)
+            paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert the customised data download of the Trading app to columnar files.')
+    parser.add_argument('csv', help='CSV file of the customised data download')
+    parser.add_argument('out_dir', help='directory of the partitioned files')
+    parser.add_argument('--format', choices=FORMATS, default=None, help='file format (default: parquet if pyarrow is installed, otherwise npz)')
+    args = parser.parse_args(argv)
+    with open(args.csv, newline='', encoding='utf-8-sig') as f:
+        paths = export(csv.reader(f), args.out_dir, args.format)
+    print(f'{len(paths)} files written to {args.out_dir}')
+
+
+if __name__ == '__main__':
+    main()
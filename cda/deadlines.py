@@ -0,0 +1,59 @@
+"""Page deadlines of the participants, shared by the preparation and the Trading app.
+
+A timed page gets a server-side deadline the first time a participant reaches it in a round. Later visits of the same
+page (refresh, browser back button) use the same deadline, such that the remaining time can only decrease.
+
+A participant is only ever on one page, so only the deadlines of their latest pages are needed. They are kept as a
+fixed number of [page, round, deadline] slots in ``participant.vars``; the deadline of a new page replaces the oldest
+slot. The size of the vars blob, which oTree loads and saves with every request, therefore stays the same for the
+whole session instead of growing by one entry per page and round.
+"""
+import time
+
+SLOTS = 2  # deadlines kept per participant
+VARS_KEY = 'deadlines'
+LEGACY_VARS_KEY = 'page_deadlines'  # dict of one deadline per page and round of earlier versions
+
+
+def get_deadline(participant_vars, page_name, round_number):
+    """Return the deadline of a page from a participant's vars, or None if it has none yet."""
+    for page, round_, deadline in participant_vars.get(VARS_KEY, ()):
+        if page == page_name and round_ == round_number:
+            return deadline
+    return None
+
+
+def set_deadline(participant_vars, page_name, round_number, deadline):
+    """Store the deadline of a page in a participant's vars, replacing the oldest deadline if all slots are used."""
+    slots = [s for s in participant_vars.get(VARS_KEY, ()) if not (s[0] == page_name and s[1] == round_number)]
+    slots.append([page_name, round_number, deadline])
+    participant_vars[VARS_KEY] = slots[-SLOTS:]
+    participant_vars.pop(LEGACY_VARS_KEY, None)
+
+
+def persistent_timeout(player, page_name: str, default_seconds: float) -> float:
+    """
+    Create a server-side deadline the first time the player reaches a page in a given round.
+    Subsequent visits (via browser back button, refresh, etc.) use the same deadline so the
+    remaining time can only decrease.
+    """
+    participant_vars = player.participant.vars
+    now = time.time()
+    deadline = get_deadline(participant_vars, page_name, player.round_number)
+    if deadline is None:
+        deadline = now + default_seconds
+        set_deadline(participant_vars, page_name, player.round_number, deadline)
+    return max(0, deadline - now)
+
+
+def set_deadlines(players, page_name: str, seconds: float, now=None):
+    """
+    Give a page the same deadline for several players at once, e.g. for a whole group at a wait page.
+
+    Returns:
+        float: The deadline
+    """
+    deadline = (time.time() if now is None else now) + seconds
+    for p in players:
+        set_deadline(p.participant.vars, page_name, p.round_number, deadline)
+    return deadline
@@ -0,0 +1,79 @@
+"""Downsampling of price series for charts.
+
+Charts only need a few hundred points to show the course of a market, while a long round can produce thousands of
+trades and quotes. ``lttb`` keeps the visually most important points (Largest-Triangle-Three-Buckets, Steinarsson 2013).
+``SortedSeries`` keeps the points of a running market sorted as they arrive, such that a chart can be redrawn, or
+extended by the points after a given time, without sorting them again. The raw data remain in the export.
+"""
+from bisect import bisect_right, insort
+from heapq import merge
+
+
+def lttb(points, max_points):
+    """
+    Reduce a series to at most max_points points with the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and the last point are always kept. In between, the series is split into max_points - 2 buckets and from
+    each bucket the point forming the largest triangle with the previously kept point and the average of the next bucket is kept.
+
+    Args:
+        points: List of (x, y) pairs sorted by x
+        max_points: Maximum number of points to return (None or 0 keeps all points)
+
+    Returns:
+        list: The kept (x, y) pairs, in the order of points
+    """
+    n = len(points)
+    if not max_points or n <= max_points:
+        return list(points)
+    if max_points < 3:
+        return [points[0], points[-1]][:max_points]
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (max_points - 2)
+    a = 0
+    for i in range(max_points - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        next_bucket = points[end:next_end] or [points[-1]]
+        avg_x = sum(p[0] for p in next_bucket) / len(next_bucket)
+        avg_y = sum(p[1] for p in next_bucket) / len(next_bucket)
+        ax, ay = points[a]
+        best, best_area = start, -1
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+class SortedSeries:
+    """Points (x, y) of a chart, kept sorted by x as they are added."""
+
+    def __init__(self, points=()):
+        self.points = sorted(points)
+
+    def __len__(self):
+        return len(self.points)
+
+    def add(self, x, y):
+        # points mostly arrive in time order; an older one (e.g., restored from a buffer) is inserted in place
+        if not self.points or x >= self.points[-1][0]:
+            self.points.append((x, y))
+        else:
+            insort(self.points, (x, y))
+
+    def since(self, since=None):
+        """Return the points with x after since, or all points if since is None."""
+        if since is None:
+            return self.points
+        return self.points[bisect_right(self.points, (since, float('inf'))):]
+
+
+def merge_series(series, since=None):
+    """Return the points of several SortedSeries after since, merged in order of x without sorting them again."""
+    return list(merge(*(s.since(since) for s in series)))
@@ -0,0 +1,132 @@
+"""Inequality measures for endowments, holdings and utilities.
+
+All measures are computed from the sorted values, i.e. in O(n log n). Batches of equally sized groups
+(e.g., every group of a subsession or all groups and rounds of an export) are computed in one NumPy call
+when NumPy is installed, otherwise group by group in pure Python with the same results.
+"""
+import math
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, the pure Python path gives the same results
+    np = None
+
+MEASURES = ['gini', 'theil', 'atkinson']
+
+
+def gini(values):
+    """
+    Calculate the Gini coefficient: 0 = perfect equality, 1 = maximum inequality.
+
+    Uses the sorted-cumulative form of G = (Σ Σ |x_i - x_j|) / (2 * n^2 * μ), namely
+    G = (2 * Σ i * x_(i)) / (n * Σ x) - (n + 1) / n with x sorted ascending and i = 1..n.
+
+    Args:
+        values: List of numerical values
+
+    Returns:
+        float: Gini coefficient (between 0 and 1)
+    """
+    n = len(values)
+    if n == 0 or len(set(values)) == 1:  # perfect equality
+        return 0.0
+    total = sum(values)
+    if total == 0:
+        return 0.0
+    weighted = sum(i * x for i, x in enumerate(sorted(values), start=1))
+    g = 2 * weighted / (n * total) - (n + 1) / n
+    return max(0.0, min(1.0, g))
+
+
+def theil(values):
+    """
+    Calculate the Theil T index: 0 = perfect equality, ln(n) = maximum inequality.
+    Zero values contribute nothing; negative values are not defined and count as zero.
+    """
+    n = len(values)
+    if n == 0 or len(set(values)) == 1:  # perfect equality
+        return 0.0
+    mean = sum(values) / n
+    if mean <= 0:
+        return 0.0
+    t = sum(x / mean * math.log(x / mean) for x in values if x > 0) / n
+    return max(0.0, t)
+
+
+def atkinson(values, epsilon=0.5):
+    """
+    Calculate the Atkinson index with inequality aversion epsilon: 0 = perfect equality, 1 = maximum inequality.
+    With epsilon >= 1, a single zero value yields 1.
+    """
+    n = len(values)
+    if n == 0 or len(set(values)) == 1:  # perfect equality
+        return 0.0
+    mean = sum(values) / n
+    if mean <= 0:
+        return 0.0
+    values = [max(x, 0) for x in values]
+    if epsilon == 1:
+        if min(values) == 0:
+            return 1.0
+        equally_distributed = math.exp(sum(math.log(x) for x in values) / n)
+    else:
+        if epsilon > 1 and min(values) == 0:
+            return 1.0
+        equally_distributed = (sum(x ** (1 - epsilon) for x in values) / n) ** (1 / (1 - epsilon))
+    return max(0.0, min(1.0, 1 - equally_distributed / mean))
+
+
+def inequality(values, epsilon=0.5):
+    """Return all measures for one list of values as a dict with the keys in MEASURES."""
+    return dict(gini=gini(values), theil=theil(values), atkinson=atkinson(values, epsilon))
+
+
+def inequality_batch(rows, epsilon=0.5):
+    """
+    Return the measures of many lists of values at once, e.g. the cash holdings of every group in a subsession.
+
+    Args:
+        rows: List of lists of values (or a 2D NumPy array with one row per group)
+        epsilon: Inequality aversion of the Atkinson index
+
+    Returns:
+        list: One dict with the keys in MEASURES per row
+    """
+    rows = [list(r) for r in rows]
+    if np is None or not rows or len({len(r) for r in rows}) != 1 or not rows[0]:
+        return [inequality(r, epsilon) for r in rows]
+    return _inequality_numpy(np.asarray(rows, dtype=float), epsilon)
+
+
+def _inequality_numpy(x, epsilon):
+    n = x.shape[1]
+    total = x.sum(axis=1)
+    mean = total / n
+    positive = mean > 0
+    safe_total = np.where(total == 0, 1, total)
+    safe_mean = np.where(positive, mean, 1)
+
+    ranks = np.arange(1, n + 1)
+    g = 2 * (np.sort(x, axis=1) * ranks).sum(axis=1) / (n * safe_total) - (n + 1) / n
+    g = np.where(total == 0, 0.0, np.clip(g, 0.0, 1.0))
+
+    share = np.clip(x, 0, None) / safe_mean[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(share > 0, share * np.log(np.where(share > 0, share, 1)), 0.0).sum(axis=1) / n
+    t = np.where(positive, np.clip(t, 0.0, None), 0.0)
+
+    clipped = np.clip(x, 0, None)
+    has_zero = (clipped == 0).any(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if epsilon == 1:
+            ede = np.exp(np.log(np.where(clipped > 0, clipped, 1)).mean(axis=1))
+        else:
+            ede = (np.where(clipped > 0, clipped, 0) ** (1 - epsilon)).mean(axis=1) ** (1 / (1 - epsilon))
+    a = np.clip(1 - ede / safe_mean, 0.0, 1.0)
+    if epsilon >= 1:
+        a = np.where(has_zero, 1.0, a)
+    a = np.where(positive, a, 0.0)
+
+    equal = x.min(axis=1) == x.max(axis=1)  # perfect equality
+    g, t, a = (np.where(equal, 0.0, m) for m in (g, t, a))
+    return [dict(gini=float(gi), theil=float(ti), atkinson=float(ai)) for gi, ti, ai in zip(g, t, a)]
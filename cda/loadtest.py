@@ -0,0 +1,126 @@
+"""Building blocks of the market load test.
+
+The load test sends random market messages at a target rate and reports latency percentiles, payload sizes and
+database writes per message. The message generator and the report do not depend on oTree; the Trading bots
+(``Trading/tests.py``) feed them from ``call_live_method``.
+"""
+import json
+import random
+import time
+from collections import defaultdict
+
+# share of each operation among the generated messages
+MESSAGE_MIX = dict(limit_order=0.4, cancel_limit=0.15, market_order=0.35, buy_good=0.1)
+PERCENTILES = [50, 95, 99]
+
+
+def parse_mix(text):
+    """Parse a message mix like 'limit_order=0.5,market_order=0.5' into a dict; unknown operations raise a ValueError."""
+    mix = {}
+    for part in filter(None, (p.strip() for p in text.split(','))):
+        operation, share = part.split('=')
+        if operation not in MESSAGE_MIX:
+            raise ValueError(f'unknown operation {operation}, use one of {list(MESSAGE_MIX)}')
+        mix[operation] = float(share)
+    return mix
+
+
+def random_message(rng: random.Random, mix, player_id, offers, price_range=(1, 10), max_volume=3):
+    """
+    Draw a market message for one trader.
+
+    Args:
+        rng: Random number generator
+        mix: Dict {operationType: share}
+        player_id: id_in_group of the sender
+        offers: Active offers as entries of OrderBook.offers, i.e., [price, remainingVolume, offerID, makerID, isBid]
+        price_range: Lowest and highest limit price
+        max_volume: Largest limit and transaction volume
+
+    Returns:
+        dict: The message as sent by the market page; a limit order if the drawn cancellation or fill has no offer to act on
+    """
+    operation = rng.choices(list(mix), weights=list(mix.values()))[0]
+    if operation == 'cancel_limit':
+        own = [offer for offer in offers if offer[3] == player_id]
+        if own:
+            price, _, offer_id, _, is_bid = rng.choice(own)
+            return dict(operationType='cancel_limit', offerID=offer_id, makerID=player_id, limitPrice=price, isBid=int(is_bid))
+    elif operation == 'market_order':
+        others = [offer for offer in offers if offer[3] != player_id]
+        if others:
+            price, volume, offer_id, _, is_bid = rng.choice(others)
+            return dict(operationType='market_order', offerID=offer_id, isBid=int(is_bid), transactionPrice=price,
+                        transactionVolume=rng.randint(1, min(volume, max_volume)))
+    elif operation == 'buy_good':
+        return dict(operationType='buy_good', good=rng.choice('AB'), quantity=1)
+    return dict(operationType='limit_order', isBid=rng.randint(0, 1), limitPrice=rng.randint(*price_range), limitVolume=rng.randint(1, max_volume))
+
+
+def percentile(values, q):
+    """Return the q-th percentile (nearest rank) of a list of values, or None if it is empty."""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(1, -(-q * len(values) // 100))  # ceil(q / 100 * n)
+    return values[int(rank) - 1]
+
+
+class Pacer:
+    """Spaces calls of wait() to a target rate per second; a rate of 0 does not wait."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_time = time.perf_counter()
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.perf_counter()
+        if now < self.next_time:
+            time.sleep(self.next_time - now)
+        self.next_time = max(now, self.next_time) + self.interval
+
+
+class LoadReport:
+    """Collects the latency and payload size of each message and the database writes of each market."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)  # operationType -> seconds
+        self.payload_bytes = []
+        self.db_writes = 0
+        self.groups = 0
+        self.started = time.perf_counter()
+
+    def record(self, operation, seconds, payload):
+        self.latencies[operation].append(seconds)
+        self.payload_bytes.append(len(json.dumps(payload, default=str)) if payload else 0)
+
+    def add_market(self, db_writes):
+        self.groups += 1
+        self.db_writes += db_writes
+
+    @property
+    def messages(self):
+        return len(self.payload_bytes)
+
+    def rows(self):
+        """Return one row [operation, count, p50, p95, p99, max] per operation (latencies in milliseconds) and one for all."""
+        rows = []
+        everything = [s for samples in self.latencies.values() for s in samples]
+        for operation, samples in sorted(self.latencies.items()) + [('all', everything)]:
+            rows.append([operation, len(samples)] + [1000 * percentile(samples, q) for q in PERCENTILES] + [1000 * max(samples)])
+        return rows
+
+    def format(self):
+        if not self.messages:
+            return 'no messages sent'
+        elapsed = time.perf_counter() - self.started
+        lines = [f'{self.messages} messages in {self.groups} markets, {self.messages / elapsed:.1f} messages per second']
+        lines.append('{:<14}{:>8}{:>10}{:>10}{:>10}{:>10}'.format('operation', 'count', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms'))
+        for operation, count, *ms in self.rows():
+            lines.append('{:<14}{:>8}'.format(operation, count) + ''.join(f'{m:>10.2f}' for m in ms))
+        lines.append(f'payload bytes per message: mean {sum(self.payload_bytes) / self.messages:.0f}, '
+                     f'p95 {percentile(self.payload_bytes, 95)}, max {max(self.payload_bytes)}')
+        lines.append(f'database rows written per message: {self.db_writes / self.messages:.2f}')
+        return '\n'.join(lines)
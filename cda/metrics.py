@@ -0,0 +1,123 @@
+"""In-process timing and size histograms of the market.
+
+A ``Metrics`` registry collects named histograms: durations of code spans (``span()``), the database queries issued
+within a span (if the owner reports queries via ``count_query()``), and arbitrary values such as payload sizes
+(``observe()``). Histograms use fixed geometric buckets, so recording is O(log buckets) and memory does not grow
+with the number of observations; percentiles are reported as the upper bound of the bucket they fall in.
+"""
+import json
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+def geometric_bounds(start, factor, n):
+    """Return n bucket bounds start, start * factor, start * factor ** 2, ..."""
+    return [start * factor ** i for i in range(n)]
+
+
+TIME_BOUNDS = geometric_bounds(1e-5, 2, 24)  # 10 microseconds to about 84 seconds
+SIZE_BOUNDS = geometric_bounds(1, 2, 32)  # 1 to about 2 billion (bytes, queries)
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last bucket takes values above the largest bound
+        self.count = 0
+        self.total = 0
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Return the upper bound of the bucket of the q-th percentile (the maximum for the last bucket)."""
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= rank:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self):
+        return dict(
+            count=self.count,
+            mean=self.total / self.count if self.count else None,
+            p50=self.percentile(50),
+            p95=self.percentile(95),
+            p99=self.percentile(99),
+            max=self.max,
+        )
+
+
+class Metrics:
+    """
+    Registry of named histograms.
+
+    Names follow the pattern <what>.<detail>.<unit>, e.g. 'live_method.limit_order.seconds'. A disabled registry
+    records nothing, such that instrumented code can stay in place at no cost.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.histograms = {}
+        self.queries = 0  # database queries counted so far, see count_query()
+        self.started = time.time()
+
+    def observe(self, name, value, bounds=SIZE_BOUNDS):
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(bounds)
+        histogram.add(value)
+
+    def count_query(self, *args):
+        # signature fits database event hooks, which pass the statement details as arguments
+        self.queries += 1
+
+    @contextmanager
+    def span(self, name):
+        """Record the duration (name.seconds) and the database queries (name.queries) of the enclosed code."""
+        if not self.enabled:
+            yield
+            return
+        queries = self.queries
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f'{name}.seconds', time.perf_counter() - start, TIME_BOUNDS)
+            self.observe(f'{name}.queries', self.queries - queries)
+
+    def summary(self):
+        """Return {name: {count, mean, p50, p95, p99, max}} for all histograms, sorted by name."""
+        return {name: self.histograms[name].summary() for name in sorted(self.histograms)}
+
+    def rows(self):
+        """Return the summary as table rows [name, count, mean, p50, p95, p99, max]; durations in milliseconds."""
+        rows = []
+        for name, s in self.summary().items():
+            scale = 1000 if name.endswith('.seconds') else 1
+            label = name[:-len('.seconds')] + ' (ms)' if name.endswith('.seconds') else name
+            rows.append([label, s['count']] + [round(s[k] * scale, 3) for k in ('mean', 'p50', 'p95', 'p99', 'max')])
+        return rows
+
+    def to_json(self):
+        return json.dumps(dict(started=self.started, dumped=time.time(), histograms=self.summary()), indent=1)
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_json())
+
+    def reset(self):
+        self.histograms.clear()
+        self.started = time.time()
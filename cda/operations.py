@@ -0,0 +1,45 @@
+"""Checks of the operations that the market page sends to the live_method().
+
+The order functions of the Trading app convert some fields of an operation without further checks. An operation
+that lacks one of them, or holds one that is not a number, is misspecified and must not reach them. A batch is
+checked as a whole before any of its operations is applied, such that a misspecified operation cannot leave a
+batch half applied. The batch is not atomic beyond that: an operation rejected when it is applied (e.g., for
+insufficient cash) does not undo the operations applied before it.
+"""
+
+BATCH_OPERATIONS = ['limit_order', 'cancel_limit', 'cancel_all', 'market_order', 'buy_good']
+
+# Fields that the order functions read without further checks, with the type they are converted to.
+OPERATION_FIELDS = dict(
+    limit_order=dict(isBid=int, limitPrice=float, limitVolume=int),
+    cancel_limit=dict(offerID=int, makerID=int),
+    market_order=dict(transactionVolume=int),
+)
+
+
+def misspecified(data):
+    """Return whether an operation lacks a field that its order function needs or holds one of the wrong type."""
+    fields = dict(OPERATION_FIELDS.get(data['operationType'], {}))
+    if data['operationType'] == 'market_order':
+        if 'offerID' in data:
+            fields['offerID'] = int
+        else:  # a sweep order, which names a side instead of an offer
+            fields['isBid'] = int
+    try:
+        for field, convert in fields.items():
+            convert(data[field])
+    except (KeyError, TypeError, ValueError):
+        return True
+    return False
+
+
+def batch_error(operations, max_operations):
+    """Return the message explaining why a batch is rejected as a whole, or None if its operations can be applied."""
+    if not isinstance(operations, list) or len(operations) > max_operations:
+        return f'Cannot proceed: a batch holds a list of at most {max_operations} operations.'
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get('operationType') not in BATCH_OPERATIONS:
+            return 'Cannot proceed: unknown operation in batch.'
+        if misspecified(operation):
+            return 'Cannot proceed: misspecified order in batch.'
+    return None
@@ -0,0 +1,206 @@
+from bisect import bisect_left, insort
+
+
+class OrderBook:
+    """
+    In-memory order book of a single market (one group in one round).
+
+    Active offers are kept in two sorted lists, one per side, in price-time priority:
+    bids by descending price, asks by ascending price, and ties by offerID (i.e., by arrival).
+    Best bid and best ask are answered in O(1), adding and removing an offer in O(log n) comparisons,
+    and the rendered book is cached until the next change.
+
+    Rows of the rendered book have the layout used by the market page: [price, remainingVolume, offerID, makerID].
+    With track_changes, every modification is also appended to self.changes as
+    ['add', isBid, row], ['remove', offerID] or ['update', offerID, remainingVolume], such that the owner
+    can send the changes instead of the whole book and clear the list afterwards.
+    """
+
+    def __init__(self, track_changes=False):
+        self.changes = [] if track_changes else None
+        self.offers = {}  # offerID -> [price, remainingVolume, offerID, makerID, isBid]
+        self._bids = []  # sorted keys (-price, offerID)
+        self._asks = []  # sorted keys (price, offerID)
+        self._bids_rows = None
+        self._asks_rows = None
+
+    @classmethod
+    def from_offers(cls, offers, track_changes=False):
+        """
+        Build a book from (offerID, price, remainingVolume, makerID, isBid) tuples of active offers,
+        e.g., when the book is restored from the Limit table.
+        """
+        book = cls()
+        for offer_id, price, remaining_volume, maker_id, is_bid in offers:
+            book.add(offer_id, price, remaining_volume, maker_id, is_bid)
+        if track_changes:
+            book.changes = []
+        return book
+
+    def __contains__(self, offer_id):
+        return offer_id in self.offers
+
+    def __len__(self):
+        return len(self.offers)
+
+    def get(self, offer_id):
+        return self.offers.get(offer_id)
+
+    def _side(self, is_bid):
+        return self._bids if is_bid else self._asks
+
+    @staticmethod
+    def _key(price, offer_id, is_bid):
+        return (-price, offer_id) if is_bid else (price, offer_id)
+
+    def _changed(self, is_bid):
+        if is_bid:
+            self._bids_rows = None
+        else:
+            self._asks_rows = None
+
+    def add(self, offer_id, price, volume, maker_id, is_bid):
+        is_bid = bool(is_bid)
+        if offer_id in self.offers:
+            self.remove(offer_id)
+        self.offers[offer_id] = [price, volume, offer_id, maker_id, is_bid]
+        insort(self._side(is_bid), self._key(price, offer_id, is_bid))
+        self._changed(is_bid)
+        if self.changes is not None:
+            self.changes.append(['add', is_bid, [price, volume, offer_id, maker_id]])
+
+    def remove(self, offer_id):
+        """Remove an offer from the book and return its entry, or None if it is not in the book."""
+        entry = self.offers.pop(offer_id, None)
+        if entry is None:
+            return None
+        price, _, _, _, is_bid = entry
+        side = self._side(is_bid)
+        del side[bisect_left(side, self._key(price, offer_id, is_bid))]
+        self._changed(is_bid)
+        if self.changes is not None:
+            self.changes.append(['remove', offer_id])
+        return entry
+
+    def fill(self, offer_id, volume):
+        """Reduce the remaining volume of an offer and drop it once nothing remains; returns the remaining volume."""
+        entry = self.offers[offer_id]
+        entry[1] -= volume
+        if entry[1] <= 0:
+            self.remove(offer_id)
+            return 0
+        self._changed(entry[4])
+        if self.changes is not None:
+            self.changes.append(['update', offer_id, entry[1]])
+        return entry[1]
+
+    def best_bid(self):
+        return -self._bids[0][0] if self._bids else None
+
+    def best_ask(self):
+        return self._asks[0][0] if self._asks else None
+
+    def best_bid_offer(self):
+        return self.offers[self._bids[0][1]] if self._bids else None
+
+    def best_ask_offer(self):
+        return self.offers[self._asks[0][1]] if self._asks else None
+
+    def side_offers(self, is_bid):
+        """Yield the entries of the bids (or asks) in price-time priority."""
+        for _, offer_id in self._side(is_bid):
+            yield self.offers[offer_id]
+
+    def _rows(self, side):
+        return [self.offers[offer_id][:4] for _, offer_id in side]
+
+    def bids(self):
+        if self._bids_rows is None:
+            self._bids_rows = self._rows(self._bids)
+        return self._bids_rows
+
+    def asks(self):
+        if self._asks_rows is None:
+            self._asks_rows = self._rows(self._asks)
+        return self._asks_rows
+
+
+def limit_crosses(book, is_bid, price):
+    """
+    Return whether a limit order at price would reach the other side of the book, i.e., a bid at or above the best ask
+    or an ask at or below the best bid. The market page first fills such orders against the offers of the others (see
+    matching_offer()) and rejects what still reaches the book, which then only holds own offers at that price; a book
+    at rest therefore never has a bid at or above an ask.
+    """
+    best = book.best_ask() if is_bid else book.best_bid()
+    return best is not None and (price >= best if is_bid else price <= best)
+
+
+def matching_offer(book, is_bid, price, own_id=None):
+    """
+    Return the entry of the offer that a limit order of side is_bid at price trades with next, or None if the order does
+    not reach the other side of the book. Offers are matched in price-time priority: the best price first and, at the
+    same price, the oldest offer. Offers of the maker own_id are skipped, as participants cannot trade with themselves.
+    """
+    for entry in book.side_offers(not is_bid):
+        if price < entry[0] if is_bid else price > entry[0]:
+            return None
+        if entry[3] != own_id:
+            return entry
+    return None
+
+
+
+def match_order(book, is_bid, price, volume, own_id, fill):
+    """
+    Fill an order of side is_bid with a limit (or worst) price against the other side of the book in price-time
+    priority, skipping the offers of own_id (see matching_offer()). fill(entry, volume) trades volume with the offer
+    of entry and returns whether it did; matching stops at the first rejected fill.
+
+    Returns:
+        tuple: (remaining volume, whether a fill was rejected)
+    """
+    while volume > 0:
+        entry = matching_offer(book, is_bid, price, own_id)
+        if entry is None:
+            break
+        amount = min(volume, entry[1])
+        if not fill(entry, amount):
+            return volume, True
+        volume -= amount
+    return volume, False
+
+def sweep_fills(book, is_bid, price, volume, own_id, budget):
+    """
+    Walk the other side of the book once for a sweep order of side is_bid up to a worst price, skipping the offers of
+    own_id (see matching_offer()). budget is the cash (bids) or the assets (asks) the order can spend; the walk stops at
+    the first fill it does not cover. The book is not changed, such that all fills can be written together.
+
+    Returns:
+        tuple: ([(entry, volume)] in price-time priority, remaining volume, whether a fill was rejected)
+    """
+    fills = []
+    for entry in book.side_offers(not is_bid):
+        if volume <= 0 or (price < entry[0] if is_bid else price > entry[0]):
+            break
+        if entry[3] == own_id:
+            continue
+        amount = min(volume, entry[1])
+        cost = amount * entry[0] if is_bid else amount
+        if cost > budget:
+            return fills, volume, True
+        fills.append((entry, amount))
+        budget -= cost
+        volume -= amount
+    return fills, volume, False
+
+def better_offer_available(book, is_bid, price, own_id=None):
+    """
+    Return whether accepting the offer of side is_bid at price skips a better offer of the same side,
+    i.e., a higher bid or a lower ask. The market page only lets participants accept the best offers;
+    offers of own_id, who cannot accept their own offers, do not count.
+    """
+    for entry in book.side_offers(is_bid):
+        if entry[3] != own_id:
+            return entry[0] > price if is_bid else entry[0] < price
+    return False
@@ -0,0 +1,187 @@
+"""Offline replay of the markets recorded in the Orders table.
+
+The Orders table of the customised data download logs every limit order, market order and cancellation of a market
+with its offerID. Replaying these events in orderID order through an ``OrderBook`` with the rules of the market page
+rebuilds the order book at every point in time without a running oTree server, e.g.
+
+    python -m cda.replay Trading_custom_export.csv --out quotes.csv
+
+writes best bid, best ask and depth after each event and prints a summary per market. Holdings are tracked from the
+trades only (good purchases are not part of the Orders table); pass initial holdings to obtain absolute values.
+Events that contradict the book or the rules of the market page, and recorded best quotes that differ from the
+replayed ones, are reported as violations.
+"""
+import argparse
+import csv
+from collections import defaultdict
+
+from cda.columnar import COLUMN_TYPES, STR, parse, read_tables
+from cda.orderbook import OrderBook, better_offer_available, limit_crosses
+
+SERIES_HEADER = ['sessionID', 'Period', 'group', 'orderID', 'orderTime', 'orderType', 'bestBid', 'bestAsk', 'bidDepth', 'askDepth']
+
+
+class MarketReplay:
+    """
+    Replays the orders of one market (one group in one period).
+
+    Attributes:
+        book: The OrderBook after the events applied so far
+        holdings: {playerID: [cash, assets]}, changed by the trades
+        series: One [orderID, orderTime, orderType, bestBid, bestAsk, bidDepth, askDepth] row per event
+        trades: One [orderID, orderTime, price, volume, buyerID, sellerID] row per market order
+        violations: One [orderID, description] row per inconsistent event
+    """
+
+    def __init__(self, holdings=None):
+        self.book = OrderBook()
+        self.holdings = defaultdict(lambda: [0.0, 0])
+        for player_id, (cash, assets) in (holdings or {}).items():
+            self.holdings[player_id] = [cash, assets]
+        self.depth = {True: 0, False: 0}  # remaining volume per side, keyed by isBid
+        self.series = []
+        self.trades = []
+        self.violations = []
+
+    def apply(self, order):
+        """Apply one row of the Orders table, given as a dict of typed values."""
+        order_type = order['orderType']
+        if order_type == 'limitOrder':
+            self.limit_order(order)
+        elif order_type == 'marketOrder':
+            self.market_order(order)
+        elif order_type == 'cancelLimitOrder':
+            self.cancel_limit(order)
+        else:
+            self.violations.append([order['orderID'], f'unknown order type {order_type}'])
+            return
+        self.check_quotes(order)
+        self.series.append([order['orderID'], order_time(order), order_type, self.book.best_bid(), self.book.best_ask(),
+                            self.depth[True], self.depth[False]])
+
+    def limit_order(self, order):
+        is_bid = bool(order['isBid'])
+        if limit_crosses(self.book, is_bid, order['price']):
+            self.violations.append([order['orderID'], f'limit order {order["offerID"]} crosses the book'])
+        self.book.add(order['offerID'], order['price'], order['limitVolume'], order['maker'], is_bid)
+        self.depth[is_bid] += order['limitVolume']
+
+    def market_order(self, order):
+        offer_id = order['offerID']
+        entry = self.book.get(offer_id)
+        if entry is None:
+            self.violations.append([order['orderID'], f'market order on offer {offer_id}, which is not in the book'])
+            return
+        price, remaining, _, maker_id, is_bid = entry
+        volume = order.get('transactionVolume')
+        if volume is None:  # older downloads only record the remaining volume after the trade
+            volume = remaining - (order.get('remainingVolume') or 0)
+        volume = min(volume, remaining)
+        taker_id = order.get('taker')
+        if better_offer_available(self.book, is_bid, price, taker_id):
+            self.violations.append([order['orderID'], f'market order on offer {offer_id} skips a better offer'])
+        if taker_id == maker_id:
+            self.violations.append([order['orderID'], f'market order on own offer {offer_id}'])
+        buyer_id, seller_id = (maker_id, taker_id) if is_bid else (taker_id, maker_id)
+        self.book.fill(offer_id, volume)
+        self.depth[is_bid] -= volume
+        self.holdings[buyer_id][0] -= volume * price
+        self.holdings[buyer_id][1] += volume
+        self.holdings[seller_id][0] += volume * price
+        self.holdings[seller_id][1] -= volume
+        self.trades.append([order['orderID'], order_time(order), price, volume, buyer_id, seller_id])
+
+    def cancel_limit(self, order):
+        entry = self.book.remove(order['offerID'])
+        if entry is None:
+            self.violations.append([order['orderID'], f'cancellation of offer {order["offerID"]}, which is not in the book'])
+            return
+        self.depth[entry[4]] -= entry[1]
+
+    def check_quotes(self, order):
+        for column, replayed in (('bestBidAfter', self.book.best_bid()), ('bestAskAfter', self.book.best_ask())):
+            recorded = order.get(column)
+            if column in order and not same_price(recorded, replayed):
+                self.violations.append([order['orderID'], f'{column} recorded {recorded}, replayed {replayed}'])
+
+    def summary(self):
+        spreads = [ask - bid for _, _, _, bid, ask, _, _ in self.series if bid is not None and ask is not None]
+        return dict(
+            events=len(self.series),
+            trades=len(self.trades),
+            volume=sum(t[3] for t in self.trades),
+            meanSpread=sum(spreads) / len(spreads) if spreads else None,
+            openOffers=len(self.book),
+            violations=len(self.violations),
+        )
+
+
+def order_time(order):
+    # cancellations and older downloads lack some of the time columns
+    for column in ('orderTime', 'transactionTime', 'offerTime'):
+        if order.get(column) is not None:
+            return order[column]
+    return None
+
+
+def same_price(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return abs(a - b) < 1e-6
+
+
+def read_orders(rows):
+    """Return the rows of the Orders table of a customised data download as dicts of typed values."""
+    for name, header, table in read_tables(rows):
+        if name != 'Orders':
+            continue
+        for row in table:
+            yield {column: parse(row[i] if i < len(row) else None, COLUMN_TYPES.get(column, STR), column)
+                   for i, column in enumerate(header) if column != 'TableName'}
+
+
+def replay(orders, holdings=None):
+    """
+    Replay the markets of a list of Orders rows.
+
+    Args:
+        orders: Iterable of dicts as returned by read_orders()
+        holdings: Optional {(sessionID, Period, group): {playerID: (cash, assets)}} at the start of each market
+
+    Returns:
+        dict: {(sessionID, Period, group): MarketReplay}, sorted by market
+    """
+    markets = defaultdict(list)
+    for order in orders:
+        markets[(order.get('sessionID'), order['Period'], order['group'])].append(order)
+    replays = {}
+    for key in sorted(markets, key=lambda k: tuple('' if v is None else v for v in k)):
+        market = MarketReplay((holdings or {}).get(key))
+        for order in sorted(markets[key], key=lambda o: o['orderID']):
+            market.apply(order)
+        replays[key] = market
+    return replays
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay the markets of the Orders table of the Trading app.')
+    parser.add_argument('csv', help='CSV file of the customised data download')
+    parser.add_argument('--out', help='CSV file for best bid, best ask and depth after each event')
+    args = parser.parse_args(argv)
+    with open(args.csv, newline='', encoding='utf-8-sig') as f:
+        replays = replay(read_orders(csv.reader(f)))
+    for key, market in replays.items():
+        print(*key, market.summary())
+        for order_id, description in market.violations:
+            print(f'  orderID {order_id}: {description}')
+    if args.out:
+        with open(args.out, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(SERIES_HEADER)
+            for key, market in replays.items():
+                for row in market.series:
+                    writer.writerow(list(key) + row)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Endowment, supply shock and goods rules of the carbon credit market.
+
+The Trading app and the simulation (cda/simulation.py) apply the same rules through the functions of this module.
+MARKET holds the parameters of the experiment; the constants class C of the Trading app reads them from here, such
+that they are defined once. The functions take such a parameter dict, which lets the simulation vary them.
+"""
+
+MARKET = dict(
+    PLAYERS_PER_GROUP=6,
+    NUM_ROUNDS=7,  # incl. trial rounds
+    num_trial_rounds=1,
+    num_assets_MIN=10,
+    num_assets_MAX=10,
+    cash_MIN_heterogeneous=5,
+    cash_homogeneous=25,
+    decimals=2,
+    supply_shock_intensity=1,  # 0.8 = 20% reduction, 1.0 = no shock, 0.5 = 50% reduction
+    # Good A (oatmilk): money price 3, carbon price 1; Good B (cowmilk): money price 2, carbon price 3
+    GOOD_A_MONEY_PRICE=3,
+    GOOD_A_CARBON_PRICE=1,
+    GOOD_B_MONEY_PRICE=2,
+    GOOD_B_CARBON_PRICE=3,
+    # Satisfaction points (constant marginal utility); conventional prefers Good B, eco prefers Good A
+    SATISFACTION_CONVENTIONAL_GOOD_A=6,
+    SATISFACTION_CONVENTIONAL_GOOD_B=12,
+    SATISFACTION_ECO_GOOD_A=12,
+    SATISFACTION_ECO_GOOD_B=6,
+)
+GOODS = ['A', 'B']
+PREFERENCES = ['conventional', 'eco']
+
+
+def good_money_price(params, good):
+    """Return the money price of a good; raises ValueError for an unknown good."""
+    if good not in GOODS:
+        raise ValueError(f'Invalid good: {good}')
+    return params[f'GOOD_{good}_MONEY_PRICE']
+
+
+def good_carbon_price(params, good):
+    """Return the carbon credits a good costs; raises ValueError for an unknown good."""
+    if good not in GOODS:
+        raise ValueError(f'Invalid good: {good}')
+    return params[f'GOOD_{good}_CARBON_PRICE']
+
+
+def good_satisfaction(params, good, preference):
+    """Return the satisfaction points of a good for a preference; raises ValueError for unknown values."""
+    if preference not in PREFERENCES:
+        raise ValueError(f'Invalid preference: {preference}')
+    if good not in GOODS:
+        raise ValueError(f'Invalid good: {good}')
+    return params[f'SATISFACTION_{preference.upper()}_GOOD_{good}']
+
+
+def goods_utility(params, preference, quantities):
+    """Return the utility of the goods {good: quantity} for a preference."""
+    return sum(qty * good_satisfaction(params, good, preference) for good, qty in quantities.items())
+
+
+def purchase_cost(params, good, qty):
+    """Return (money, credits) that qty units of a good cost; raises ValueError for an unknown good."""
+    return good_money_price(params, good) * qty, good_carbon_price(params, good) * qty
+
+
+def affordable(cost, available_cash, available_assets):
+    """Return whether a purchase of cost (money, credits) is covered; resources locked in open offers are not available."""
+    money, credits = cost
+    return available_cash >= money and available_assets >= credits
+
+
+def shock_round(params):
+    """Return the first round (counting trial rounds) with the supply shock, which starts after half of the trading rounds."""
+    num_trading_rounds = params['NUM_ROUNDS'] - params['num_trial_rounds']
+    return num_trading_rounds // 2 + params['num_trial_rounds'] + 1
+
+
+def asset_endowment(params, round_number, rng):
+    """Return a participant's carbon credits in a round, reduced by the supply shock intensity from shock_round() on."""
+    endowment = int(rng.uniform(params['num_assets_MIN'], params['num_assets_MAX']))
+    if round_number >= shock_round(params):
+        return int(endowment * params['supply_shock_intensity'])
+    return endowment
+
+
+def heterogeneous_cash(params, group_size, rng):
+    """
+    Distribute cash_homogeneous * group_size randomly among the members of a group, each at least
+    cash_MIN_heterogeneous. All but the last amount are rounded; the last one gets exactly the rest.
+
+    Returns:
+        list: One amount per member, in order of id_in_group
+    """
+    minimum = params['cash_MIN_heterogeneous']
+    total = params['cash_homogeneous'] * group_size
+    unrounded, remaining = [], total
+    for i in range(group_size - 1):
+        # Maximum available for this player, keeping the minimum for all remaining players
+        upper = max(remaining - minimum * (group_size - i - 1), minimum)
+        amount = rng.uniform(minimum, upper)
+        unrounded.append(amount)
+        remaining -= amount
+    amounts = [float(round(amount, params['decimals'])) for amount in unrounded]
+    last = total - sum(amounts)
+    if last < minimum and amounts:
+        # Rounding left the last player short of the minimum: take the shortage from the player before
+        amounts[-1] = max(minimum, amounts[-1] - (minimum - last))
+        last = total - sum(amounts)
+    amounts.append(float(round(last, params['decimals'])))
+    return amounts
+
+
+def cash_endowments(params, group_size, endowment_type, rng):
+    """Return the cash endowments of a group, in order of id_in_group."""
+    if endowment_type == 'heterogeneous':
+        return heterogeneous_cash(params, group_size, rng)
+    return [float(round(params['cash_homogeneous'], params['decimals']))] * group_size
@@ -0,0 +1,327 @@
+"""Agent-based simulation of the carbon credit market for pre-testing parameters.
+
+Each simulated session has the groups, endowments, supply shock, goods and scores of the Trading app, with
+synthetic traders instead of participants:
+
+- zero-intelligence traders (Gode and Sunder 1993) place budget-constrained limit orders at random prices, which
+  trade with the other side of the book when they reach it;
+- utility traders value a credit by the best net satisfaction it buys ((satisfaction - money price) / carbon price of
+  their preferred use), buy below and sell above that value, and place limit orders around it.
+
+Orders go through the same ``OrderBook`` and rules as the market page (limit orders that reach the other side are
+filled in price-time priority, only the best offers can be accepted, resources in open offers are locked).
+Endowments, the supply shock, goods prices and utilities come from ``cda/rules.py``, which the Trading app uses as
+well, and at the end of a round every trader spends the remaining credits on goods. Markets are event driven and therefore run in
+a process pool, one session per task:
+
+    python -m cda.simulation --sessions 2000 --sweep supply_shock_intensity=0.6,0.8,1 --out sweep.csv
+
+The defaults of PARAMS are the market parameters of the Trading app (``rules.MARKET``) and the settings of the
+synthetic traders; ``--set`` and ``--sweep`` override them.
+"""
+import argparse
+import csv
+import itertools
+import multiprocessing
+import random
+import statistics
+from collections import defaultdict
+
+from cda import rules
+from cda.inequality import gini
+from cda.orderbook import OrderBook, limit_crosses, match_order, matching_offer
+
+PARAMS = dict(
+    rules.MARKET,
+    endowment_type='homogeneous',
+    zi_share=0.5,  # share of zero-intelligence traders, the others are utility traders
+    steps=300,  # trader actions per round
+    max_price=20,  # highest price of zero-intelligence traders
+    max_volume=3,
+    cancel_probability=0.1,
+    good_probability=0.1,  # probability that a trader buys a good instead of trading credits
+)
+RESULT_COLUMNS = ['session', 'round', 'shocked', 'trades', 'volume', 'meanPrice', 'lastPrice',
+                  'giniCash', 'giniUtility', 'meanUtilityChangePercent']
+
+
+class Trader:
+    def __init__(self, trader_id, preference, cash, assets, zero_intelligence):
+        self.id = trader_id
+        self.preference = preference
+        self.cash = self.initial_cash = cash
+        self.assets = assets
+        self.cash_offered = 0
+        self.assets_offered = 0
+        self.goods = dict(A=0, B=0)
+        self.zero_intelligence = zero_intelligence
+
+    def satisfaction(self, good, params):
+        return rules.good_satisfaction(params, good, self.preference)
+
+    def goods_utility(self, params):
+        return rules.goods_utility(params, self.preference, self.goods)
+
+    def overall_utility(self, params):
+        return self.goods_utility(params) + self.cash
+
+    def best_good(self, params, cash, assets):
+        # the affordable good with the highest net satisfaction (satisfaction - money price), or None
+        options = [(self.satisfaction(g, params) - rules.good_money_price(params, g), g) for g in rules.GOODS
+                   if rules.affordable(rules.purchase_cost(params, g, 1), cash, assets)]
+        options = [o for o in options if o[0] > 0]
+        return max(options)[1] if options else None
+
+    def credit_value(self, params):
+        # net satisfaction a credit buys in its best use
+        return max((self.satisfaction(g, params) - rules.good_money_price(params, g)) / rules.good_carbon_price(params, g)
+                   for g in rules.GOODS)
+
+
+def buy_good(trader, good, params, qty=1):
+    # the rules of buy_good() in the Trading app: resources locked in open offers are not available
+    price, credits = rules.purchase_cost(params, good, qty)
+    if not rules.affordable((price, credits), trader.cash - trader.cash_offered, trader.assets - trader.assets_offered):
+        return False
+    trader.goods[good] += qty
+    trader.cash -= price
+    trader.assets -= credits
+    return True
+
+
+class Market:
+    """One group in one round: the order book, the traders and the trades."""
+
+    def __init__(self, traders, params, rng):
+        self.traders = {t.id: t for t in traders}
+        self.params = params
+        self.rng = rng
+        self.book = OrderBook()
+        self.next_offer_id = 0
+        self.trades = []  # [price, volume]
+
+    def limit_order(self, trader, is_bid, price, volume):
+        price = round(price, self.params['decimals'])
+        if price <= 0 or volume <= 0:
+            return False
+        if is_bid and trader.cash - trader.cash_offered - volume * price < 0:
+            return False
+        if not is_bid and trader.assets - trader.assets_offered - volume < 0:
+            return False
+        # like match_limit_order() of the Trading app: fill against the other side, then place the remaining volume
+        volume, rejected = match_order(self.book, is_bid, price, volume, trader.id,
+                                       lambda entry, amount: self.accept(trader, not is_bid, amount))
+        if rejected or not volume or limit_crosses(self.book, is_bid, price):  # a rejected fill ends the order
+            return True
+        self.next_offer_id += 1
+        self.book.add(self.next_offer_id, price, volume, trader.id, is_bid)
+        if is_bid:
+            trader.cash_offered += volume * price
+        else:
+            trader.assets_offered += volume
+        return True
+
+    def cancel(self, trader):
+        own = [offer_id for offer_id, entry in self.book.offers.items() if entry[3] == trader.id]
+        if not own:
+            return False
+        price, remaining, _, _, is_bid = self.book.remove(self.rng.choice(own))
+        if is_bid:
+            trader.cash_offered -= remaining * price
+        else:
+            trader.assets_offered -= remaining
+        return True
+
+    def accept(self, trader, is_bid, volume):
+        # market order on the best offer of others of side is_bid, as the market page only lets traders accept the best offers
+        entry = matching_offer(self.book, not is_bid, 0 if is_bid else float('inf'), trader.id)
+        if entry is None:
+            return False
+        price, remaining, offer_id, maker_id, _ = entry
+        volume = min(volume, remaining)
+        if not is_bid and trader.cash - trader.cash_offered - volume * price < 0:
+            return False
+        if is_bid and trader.assets - trader.assets_offered - volume < 0:
+            return False
+        maker = self.traders[maker_id]
+        buyer, seller = (maker, trader) if is_bid else (trader, maker)
+        if is_bid:
+            maker.cash_offered -= volume * price
+        else:
+            maker.assets_offered -= volume
+        buyer.cash -= volume * price
+        seller.cash += volume * price
+        buyer.assets += volume
+        seller.assets -= volume
+        self.book.fill(offer_id, volume)
+        self.trades.append([price, volume])
+        return True
+
+    def step(self):
+        trader = self.rng.choice(list(self.traders.values()))
+        params, rng = self.params, self.rng
+        volume = rng.randint(1, params['max_volume'])
+        if rng.random() < params['cancel_probability']:
+            self.cancel(trader)
+        elif rng.random() < params['good_probability']:
+            good = trader.best_good(params, trader.cash - trader.cash_offered, trader.assets - trader.assets_offered)
+            if good:
+                buy_good(trader, good, params)
+        elif trader.zero_intelligence:
+            is_bid = rng.random() < 0.5
+            price = rng.uniform(1, params['max_price'])
+            self.limit_order(trader, is_bid, price, volume)
+        else:
+            value = trader.credit_value(params)
+            best_bid, best_ask = self.book.best_bid(), self.book.best_ask()
+            if best_ask is not None and best_ask < value and self.accept(trader, False, volume):
+                return
+            if best_bid is not None and best_bid > value and self.accept(trader, True, volume):
+                return
+            is_bid = rng.random() < 0.5
+            margin = rng.uniform(0, 0.3)
+            price = value * (1 - margin) if is_bid else value * (1 + margin)
+            if not limit_crosses(self.book, is_bid, price):
+                self.limit_order(trader, is_bid, price, volume)
+
+    def close(self):
+        # open offers expire, then every trader spends the remaining credits on goods
+        for trader in self.traders.values():
+            trader.cash_offered = 0
+            trader.assets_offered = 0
+            good = trader.best_good(self.params, trader.cash, trader.assets)
+            while good and buy_good(trader, good, self.params):
+                good = trader.best_good(self.params, trader.cash, trader.assets)
+
+
+def simulate_session(params, seed):
+    """
+    Simulate one group through all trading rounds (NUM_ROUNDS without the trial rounds), with the supply shock after
+    half of them.
+
+    Returns:
+        list: One dict with the keys of RESULT_COLUMNS per round
+    """
+    rng = random.Random(seed)
+    n = params['PLAYERS_PER_GROUP']
+    cash = rules.cash_endowments(params, n, params['endowment_type'], rng)
+    preferences = ['conventional'] * (n - n // 2) + ['eco'] * (n // 2)
+    rng.shuffle(preferences)
+    zero_intelligence = [i < round(params['zi_share'] * n) for i in range(n)]
+    rng.shuffle(zero_intelligence)
+    results = []
+    for round_number in range(params['num_trial_rounds'] + 1, params['NUM_ROUNDS'] + 1):
+        shocked = round_number >= rules.shock_round(params)
+        traders = []
+        for i in range(n):
+            assets = rules.asset_endowment(params, round_number, rng)
+            traders.append(Trader(i + 1, preferences[i], cash[i], assets, zero_intelligence[i]))
+        market = Market(traders, params, rng)
+        for _ in range(params['steps']):
+            market.step()
+        market.close()
+        utilities = [t.overall_utility(params) for t in traders]
+        changes = [(u - t.initial_cash) / t.initial_cash * 100 for u, t in zip(utilities, traders) if t.initial_cash]
+        prices = [p for p, _ in market.trades]
+        results.append(dict(
+            session=seed,
+            round=round_number - params['num_trial_rounds'],
+            shocked=shocked,
+            trades=len(market.trades),
+            volume=sum(v for _, v in market.trades),
+            meanPrice=sum(p * v for p, v in market.trades) / sum(v for _, v in market.trades) if market.trades else None,
+            lastPrice=prices[-1] if prices else None,
+            giniCash=gini([t.cash for t in traders]),
+            giniUtility=gini(utilities),
+            meanUtilityChangePercent=sum(changes) / len(changes) if changes else None,
+        ))
+    return results
+
+
+def _run(task):
+    params, seed = task
+    return params, simulate_session(params, seed)
+
+
+def simulate(params_list, sessions, processes=None, seed=0):
+    """
+    Simulate a number of sessions for each parameter set in a process pool.
+
+    Args:
+        params_list: List of parameter dicts (complete, e.g., dict(PARAMS, **overrides))
+        sessions: Number of sessions per parameter set
+        processes: Number of worker processes (default: number of CPU cores)
+        seed: Seed of the first session; sessions are numbered consecutively, so results are reproducible
+
+    Yields:
+        tuple: (params, list of round results) per session, in the order of completion
+    """
+    tasks = [(params, seed + i) for params in params_list for i in range(sessions)]
+    if processes == 1:
+        yield from map(_run, tasks)
+        return
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap_unordered(_run, tasks, chunksize=max(1, len(tasks) // (4 * (processes or multiprocessing.cpu_count()))))
+
+
+def summarise(rows, column):
+    """Return count, mean and the 5th, 50th and 95th percentile of a result column."""
+    values = sorted(r[column] for r in rows if r[column] is not None)
+    if not values:
+        return dict(n=0)
+    q = statistics.quantiles(values, n=20) if len(values) > 1 else [values[0]] * 19
+    return dict(n=len(values), mean=statistics.fmean(values), p5=q[0], p50=q[9], p95=q[18])
+
+
+def parse_value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate markets of the Trading app with synthetic traders.')
+    parser.add_argument('--sessions', type=int, default=100, help='simulated sessions (groups) per parameter set')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: CPU cores)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE', help='override a parameter')
+    parser.add_argument('--sweep', action='append', default=[], metavar='NAME=V1,V2', help='simulate each value of a parameter')
+    parser.add_argument('--out', help='CSV file with one row per simulated round')
+    args = parser.parse_args(argv)
+
+    base = dict(PARAMS)
+    for item in args.set:
+        name, value = item.split('=', 1)
+        if name not in PARAMS:
+            parser.error(f'unknown parameter {name}')
+        base[name] = parse_value(value)
+    sweeps = {}
+    for item in args.sweep:
+        name, values = item.split('=', 1)
+        if name not in PARAMS:
+            parser.error(f'unknown parameter {name}')
+        sweeps[name] = [parse_value(v) for v in values.split(',')]
+    params_list = [dict(base, **dict(zip(sweeps, values))) for values in itertools.product(*sweeps.values())]
+
+    results = defaultdict(list)
+    for params, rounds in simulate(params_list, args.sessions, args.processes, args.seed):
+        results[tuple(params[name] for name in sweeps)].extend(rounds)
+    for key in sorted(results):
+        rows = results[key]
+        print(dict(zip(sweeps, key)) or 'defaults')
+        for column in ['trades', 'volume', 'meanPrice', 'giniCash', 'giniUtility', 'meanUtilityChangePercent']:
+            print(f'  {column}: ' + ', '.join(f'{k} {v:.3f}' if isinstance(v, float) else f'{k} {v}' for k, v in summarise(rows, column).items()))
+    if args.out:
+        with open(args.out, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(list(sweeps) + RESULT_COLUMNS)
+            for key in sorted(results):
+                for r in sorted(results[key], key=lambda r: (r['session'], r['round'])):
+                    writer.writerow(list(key) + [r[c] for c in RESULT_COLUMNS])
+
+
+if __name__ == '__main__':
+    main()
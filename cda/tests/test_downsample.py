@@ -0,0 +1,25 @@
+from cda.downsample import SortedSeries, lttb, merge_series
+
+
+def test_lttb_keeps_ends_and_limit():
+    points = [(x, (x * 7) % 11) for x in range(100)]
+    sampled = lttb(points, 10)
+    assert len(sampled) == 10 and sampled[0] == points[0] and sampled[-1] == points[-1]
+    assert sampled == sorted(sampled)
+    assert lttb(points, None) == points and lttb(points[:5], 10) == points[:5]
+
+
+def test_sorted_series_and_since():
+    series = SortedSeries([(3.0, 10), (1.0, 12)])
+    series.add(5.0, 11)
+    series.add(2.0, 9)  # an older point is inserted in place
+    assert series.points == [(1.0, 12), (2.0, 9), (3.0, 10), (5.0, 11)]
+    assert series.since(2.0) == [(3.0, 10), (5.0, 11)]
+    assert series.since(5.0) == [] and series.since() == series.points and len(series) == 4
+
+
+def test_merge_series_since():
+    a, b = SortedSeries([(1.0, 5), (4.0, 6)]), SortedSeries([(2.0, 7), (3.0, 8), (6.0, 9)])
+    assert merge_series([a, b]) == [(1.0, 5), (2.0, 7), (3.0, 8), (4.0, 6), (6.0, 9)]
+    assert merge_series([a, b], since=3.0) == [(4.0, 6), (6.0, 9)]
+    assert merge_series([]) == []
@@ -0,0 +1,41 @@
+import random
+
+import pytest
+
+from cda import inequality
+from cda.inequality import atkinson, gini, inequality_batch, theil
+
+
+def pairwise_gini(values):
+    # the O(n^2) form G = (Σ Σ |x_i - x_j|) / (2 * n^2 * μ) that the Trading app used before
+    n = len(values)
+    if n == 0 or len(set(values)) == 1 or sum(values) == 0:
+        return 0.0
+    diff = sum(abs(a - b) for a in values for b in values)
+    return max(0.0, min(1.0, diff / (2 * n * n * (sum(values) / n))))
+
+
+def test_gini_matches_pairwise_form():
+    rng = random.Random(1)
+    for _ in range(200):
+        values = [round(rng.uniform(0, 50), 2) for _ in range(rng.randint(1, 12))]
+        assert gini(values) == pytest.approx(pairwise_gini(values))
+
+
+def test_edge_cases():
+    assert gini([]) == 0.0 and gini([5, 5, 5]) == 0.0 and gini([0, 0]) == 0.0
+    assert gini([0, 0, 0, 10]) == pytest.approx(0.75)
+    assert theil([1, 1]) == 0.0 and theil([0, 4]) == pytest.approx(0.6931471805599453)
+    assert atkinson([0, 4], epsilon=1) == 1.0 and atkinson([1, 4], epsilon=0.5) == pytest.approx(0.1)
+
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_batch_matches_single_groups(monkeypatch, numpy):
+    if numpy and inequality.np is None:
+        pytest.skip('NumPy is not installed')
+    if not numpy:
+        monkeypatch.setattr(inequality, 'np', None)
+    rng = random.Random(2)
+    rows = [[rng.choice([0, rng.uniform(0, 30)]) for _ in range(6)] for _ in range(50)] + [[7] * 6]
+    for row, measures in zip(rows, inequality_batch(rows)):
+        assert measures == pytest.approx(dict(gini=gini(row), theil=theil(row), atkinson=atkinson(row)))
@@ -0,0 +1,82 @@
+import random
+
+from cda.orderbook import OrderBook, better_offer_available, limit_crosses, match_order, matching_offer, sweep_fills
+from cda.simulation import PARAMS, Market, Trader
+
+
+def book_with_asks(*asks):
+    book = OrderBook()
+    for offer_id, (price, maker) in enumerate(asks, start=1):
+        book.add(offer_id, price, 1, maker, False)
+    return book
+
+
+def test_matching_offer_in_price_time_priority():
+    book = book_with_asks((6.0, 2), (5.0, 3), (5.0, 4))
+    assert matching_offer(book, True, 5.0)[2] == 2
+    assert matching_offer(book, True, 4.99) is None
+    assert matching_offer(book, False, 1.0) is None  # there are no bids
+
+
+def test_matching_offer_skips_own_offers():
+    book = book_with_asks((5.0, 1), (5.0, 2), (6.0, 1))
+    assert matching_offer(book, True, 5.0, own_id=1)[2] == 2
+    assert matching_offer(book, True, 6.0, own_id=2)[2] == 1
+    book.remove(2)
+    assert matching_offer(book, True, 6.0, own_id=1) is None
+
+
+def test_limit_crosses_includes_the_limit_price():
+    book = book_with_asks((5.0, 1))
+    assert limit_crosses(book, True, 5.0) and limit_crosses(book, True, 6.0)
+    assert not limit_crosses(book, True, 4.99) and not limit_crosses(book, False, 5.0)
+
+
+def test_better_offer_ignores_own_offers():
+    book = book_with_asks((4.0, 1), (5.0, 2))
+    assert better_offer_available(book, False, 5.0)
+    assert not better_offer_available(book, False, 5.0, own_id=1)
+    assert not better_offer_available(book, False, 4.0)
+
+
+def test_same_price_orders_do_not_lock_the_book():
+    # P1 asks 50, P2 asks 50, P1 bids 50: the bid trades with P2's ask instead of resting against it
+    traders = [Trader(i, 'eco', 1000, 10, False) for i in (1, 2)]
+    market = Market(traders, PARAMS, random.Random(0))
+    market.limit_order(traders[0], False, 50, 1)
+    market.limit_order(traders[1], False, 50, 1)
+    market.limit_order(traders[0], True, 50, 1)
+    assert market.book.bids() == [] and market.book.asks() == [[50, 1, 1, 1]]
+    assert market.trades == [[50, 1]]
+    # only the own ask is left at 50, so another bid at 50 is rejected
+    market.limit_order(traders[0], True, 50, 1)
+    assert market.book.bids() == []
+
+
+def test_match_order_stops_at_a_rejected_fill():
+    book = book_with_asks((5.0, 2), (5.0, 3), (6.0, 4))
+    fills = []
+
+    def fill(entry, volume):
+        if entry[3] == 3:  # e.g. the trade is refused for lack of cash or assets
+            return False
+        fills.append((entry[2], volume))
+        book.fill(entry[2], volume)
+        return True
+
+    assert match_order(book, True, 6.0, 3, 1, fill) == (2, True)
+    assert fills == [(1, 1)]
+    assert match_order(book, True, 4.0, 2, 1, fill) == (2, False)  # nothing to match is not a rejection
+
+
+def test_sweep_fills_walk_the_book_once_within_budget():
+    book = book_with_asks((5.0, 2), (5.0, 1), (6.0, 3), (7.0, 4))
+    book.fill(1, -1)  # two units at 5.0 from maker 2
+    fills, remaining, rejected = sweep_fills(book, True, 6.0, 5, 1, 100)
+    assert [(entry[2], volume) for entry, volume in fills] == [(1, 2), (3, 1)]
+    assert (remaining, rejected) == (2, False)
+    assert len(book) == 4  # the book is not changed
+    fills, remaining, rejected = sweep_fills(book, True, 7.0, 4, 1, 16.0)
+    assert [(entry[2], volume) for entry, volume in fills] == [(1, 2), (3, 1)] and (remaining, rejected) == (1, True)
+    fills, remaining, rejected = sweep_fills(book, False, 1.0, 1, 1, 1)
+    assert fills == [] and (remaining, rejected) == (1, False)  # there are no bids
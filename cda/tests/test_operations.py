@@ -0,0 +1,27 @@
+from cda.operations import batch_error, misspecified
+
+
+def limit(is_bid=1, price=45, volume=1):
+    return dict(operationType='limit_order', isBid=is_bid, limitPrice=price, limitVolume=volume)
+
+
+def test_misspecified_operations():
+    assert not misspecified(limit())
+    assert not misspecified(dict(operationType='limit_order', isBid='1', limitPrice='45.5', limitVolume='2'))
+    assert misspecified({'operationType': 'limit_order', 'isBid': 1})  # no limitPrice
+    assert misspecified(limit(price='abc')) and misspecified(limit(volume=None))
+    assert misspecified(dict(operationType='cancel_limit', offerID=3))
+    assert not misspecified(dict(operationType='market_order', offerID=3, transactionVolume=1))
+    assert not misspecified(dict(operationType='market_order', isBid=0, transactionVolume=2))  # a sweep order
+    assert misspecified(dict(operationType='market_order', transactionVolume=2))
+    assert not misspecified(dict(operationType='cancel_all'))
+
+
+def test_malformed_batch_is_rejected_as_a_whole():
+    operations = [limit(), {'operationType': 'limit_order', 'isBid': 1}, dict(operationType='cancel_all')]
+    assert batch_error(operations, 20) == 'Cannot proceed: misspecified order in batch.'
+    assert batch_error([limit(), dict(operationType='market_start')], 20) == 'Cannot proceed: unknown operation in batch.'
+    assert batch_error([limit(), 'cancel_all'], 20) == 'Cannot proceed: unknown operation in batch.'
+    assert batch_error(None, 20).startswith('Cannot proceed: a batch holds')
+    assert batch_error([limit()] * 3, 2).startswith('Cannot proceed: a batch holds')
+    assert batch_error([limit(), limit(0, 50, 2), dict(operationType='cancel_all')], 20) is None
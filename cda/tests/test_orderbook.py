@@ -0,0 +1,42 @@
+from cda.orderbook import OrderBook
+
+
+def test_price_time_priority():
+    book = OrderBook()
+    book.add(1, 5.0, 1, 1, True)
+    book.add(2, 6.0, 2, 2, True)
+    book.add(3, 6.0, 1, 3, True)
+    book.add(4, 8.0, 1, 1, False)
+    book.add(5, 7.0, 3, 2, False)
+    assert book.bids() == [[6.0, 2, 2, 2], [6.0, 1, 3, 3], [5.0, 1, 1, 1]]
+    assert book.asks() == [[7.0, 3, 5, 2], [8.0, 1, 4, 1]]
+    assert (book.best_bid(), book.best_ask()) == (6.0, 7.0)
+    assert book.best_bid_offer()[2] == 2
+
+
+def test_fill_and_remove():
+    book = OrderBook()
+    book.add(1, 5.0, 3, 1, False)
+    book.add(2, 6.0, 1, 2, False)
+    assert book.fill(1, 2) == 1
+    assert book.asks()[0] == [5.0, 1, 1, 1]
+    assert book.fill(1, 1) == 0
+    assert 1 not in book and len(book) == 1
+    assert book.remove(2)[:4] == [6.0, 1, 2, 2]
+    assert book.remove(2) is None
+    assert book.best_ask() is None and book.asks() == []
+
+
+def test_changes():
+    book = OrderBook(track_changes=True)
+    book.add(1, 5.0, 3, 1, True)
+    book.fill(1, 1)
+    book.remove(1)
+    assert book.changes == [['add', True, [5.0, 3, 1, 1]], ['update', 1, 2], ['remove', 1]]
+    assert OrderBook().changes is None
+
+
+def test_from_offers():
+    book = OrderBook.from_offers([(2, 4.0, 1, 2, False), (1, 3.0, 2, 1, True)], track_changes=True)
+    assert book.bids() == [[3.0, 2, 1, 1]] and book.asks() == [[4.0, 1, 2, 2]]
+    assert book.changes == []
@@ -0,0 +1,40 @@
+from cda.replay import read_orders, replay
+
+HEADER = ['TableName', 'sessionID', 'Period', 'group', 'orderID', 'offerID', 'orderType', 'isBid', 'price',
+          'limitVolume', 'transactionVolume', 'maker', 'taker', 'orderTime', 'bestBidAfter', 'bestAskAfter']
+
+
+def order(order_id, offer_id, order_type, is_bid, price, volume, maker, taker='', best_bid='', best_ask=''):
+    limit_volume, transaction_volume = (volume, '') if order_type == 'limitOrder' else ('', volume)
+    return ['Orders', 'abc', '1', '1', str(order_id), str(offer_id), order_type, str(is_bid), str(price),
+            str(limit_volume), str(transaction_volume), str(maker), str(taker), str(order_id), str(best_bid), str(best_ask)]
+
+
+def test_replay_rebuilds_book_trades_and_holdings():
+    rows = [
+        HEADER,
+        order(1, 1, 'limitOrder', 0, 6, 2, 1, best_ask=6),
+        order(2, 2, 'limitOrder', 1, 4, 1, 2, best_bid=4, best_ask=6),
+        order(3, 1, 'marketOrder', 0, 6, 1, 1, taker=3, best_bid=4, best_ask=6),
+        order(4, 2, 'cancelLimitOrder', 1, 4, '', 2, best_ask=6),
+    ]
+    market = replay(read_orders(rows))[('abc', 1, 1)]
+    assert market.violations == []
+    assert market.trades == [[3, 3.0, 6.0, 1, 3, 1]]
+    assert market.holdings[3] == [-6.0, 1] and market.holdings[1] == [6.0, -1]
+    assert [row[3:] for row in market.series] == [[None, 6.0, 0, 2], [4.0, 6.0, 1, 2], [4.0, 6.0, 1, 1], [None, 6.0, 0, 1]]
+    assert market.summary()['openOffers'] == 1
+
+
+def test_replay_reports_violations():
+    rows = [
+        HEADER,
+        order(1, 1, 'limitOrder', 0, 5, 1, 1),
+        order(2, 2, 'limitOrder', 1, 5, 1, 2),  # meets the ask at the same price
+        order(3, 1, 'marketOrder', 0, 5, 1, 1, taker=1),  # own offer
+        order(4, 9, 'cancelLimitOrder', 1, 5, '', 2),  # not in the book
+    ]
+    violations = replay(read_orders(rows))[('abc', 1, 1)].violations
+    descriptions = [d for _, d in violations if not d.startswith('best')]  # the quotes are left empty here
+    assert descriptions == ['limit order 2 crosses the book', 'market order on own offer 1',
+                            'cancellation of offer 9, which is not in the book']
@@ -0,0 +1,32 @@
+from cda.waitingroom import WaitingRoom
+
+
+def test_first_in_first_out():
+    room = WaitingRoom()
+    for key, now in [(1, 0), (2, 1), (3, 2), (1, 3)]:
+        room.arrive(key, now)
+    assert list(room) == [1, 2, 3] and room.arrivals[1] == 0  # a second arrival keeps the place
+    assert room.needed(2) == 1
+    assert room.take(4) is None and len(room) == 3
+    assert room.take(2) == [1, 2] and list(room) == [3]
+    assert room.leave(3) == 2 and room.leave(3) is None and 3 not in room
+
+
+def test_take_only_present_participants():
+    room = WaitingRoom()
+    for key in [1, 2, 3, 4]:
+        room.arrive(key, key)
+    assert room.take(2, present={2, 4}) == [2, 4]
+    assert list(room) == [1, 3]
+    assert room.take(2, present={3}) is None
+
+
+def test_deadlines_and_expiry():
+    room = WaitingRoom()
+    for key, now in [(1, 0), (2, 5), (3, 10)]:
+        room.arrive(key, now)
+    assert room.deadline(2, 60) == 65 and room.deadline(9, 60) is None
+    assert room.next_deadline(60) == 60
+    assert room.expire(64, 60) == [1]
+    assert room.expire(70, 60) == [2, 3]
+    assert room.next_deadline(60) is None
@@ -0,0 +1,41 @@
+from cda import wire
+
+
+def test_snapshot_round_trip():
+    update = dict(seq=1, snapshot=True, chart_max_points=500, bids=[[45.5, 2, 3, 1]], asks=[[50.0, 1, 4, 2]],
+                  trades=[[47.25, 1, 12.5, 2]], highcharts_series=[{'name': 'Trades', 'data': [{'x': 12.5, 'y': 47.25}]}],
+                  news=[], cashHolding=25.0, assetsHolding=10)
+    message = wire.encode(update, 100)
+    assert message[:2] == [wire.VERSION, 1]
+    decoded = wire.decode(message)  # the snapshot carries its tick size
+    assert decoded['snapshot'] and decoded['chart_max_points'] == 500
+    assert decoded['bids'] == [[45.5, 2, 3, 1]] and decoded['asks'] == [[50.0, 1, 4, 2]]
+    assert decoded['trades'] == [[47.25, 1, 12.5, 2]]
+    assert decoded['highcharts_series'][0]['data'] == [{'x': 12.5, 'y': 47.25, 'name': 'Trades'}]
+    assert decoded['cashHolding'] == 25.0 and decoded['assetsHolding'] == 10
+
+
+def test_delta_with_holdings():
+    update = dict(seq=7, book=[['add', True, [45.0, 1, 5, 3]], ['remove', 2], ['update', 4, 1]],
+                  cashHolding='94.50', assetsHolding=9, goodA_qty=1, goods_trade_good='A', goods_trade_qty=1,
+                  goods_trade_price=3.0, news=[['Bought 1 unit of good A.', 30.0, 3]])
+    message = wire.encode(update, 100)
+    decoded = wire.decode(message, 100)
+    assert decoded['seq'] == 7 and 'snapshot' not in decoded
+    assert decoded['book'] == [['add', True, [45.0, 1, 5, 3]], ['remove', 2], ['update', 4, 1]]
+    assert decoded['cashHolding'] == 94.5 and decoded['assetsHolding'] == 9 and decoded['goodA_qty'] == 1
+    assert (decoded['goods_trade_good'], decoded['goods_trade_qty'], decoded['goods_trade_price']) == ('A', 1, 3.0)
+    assert decoded['news'] == [['Bought 1 unit of good A.', 30.0, None]]
+    assert 'bids' not in decoded and 'goodB_qty' not in decoded
+
+
+def test_mask_omits_absent_fields():
+    message = wire.encode(dict(seq=3, assetsHolding=8), 100)
+    assert message == [wire.VERSION, 3, 1 << wire.FIELDS.index('assetsHolding'), 8]
+    assert wire.decode(message, 100) == dict(seq=3, assetsHolding=8)
+
+
+def test_other_version_is_not_decoded():
+    message = wire.encode(dict(seq=3, assetsHolding=8), 100)
+    assert wire.decode([wire.VERSION + 1] + message[1:], 100) is None
+    assert wire.decode([], 100) is None
@@ -0,0 +1,88 @@
+"""Waiting room of the group formation.
+
+Participants who passed the comprehension check wait until enough of them arrived to form a trading group. The
+``WaitingRoom`` keeps the waiting participants in order of arrival, such that forming a group and counting the
+waiting participants cost O(group size) instead of a scan over all participants of the session.
+
+Each participant waits at most a fixed time from their own arrival. Since all participants get the same waiting time,
+the order of arrival is also the order of the deadlines: the next deadline is the one of the first participant, and
+the participants whose waiting time ran out are a prefix of the room.
+"""
+import time
+from collections import OrderedDict
+
+
+class WaitingRoom:
+    """
+    First-in, first-out index of waiting participants.
+
+    Attributes:
+        arrivals: OrderedDict {key: arrival time} in order of arrival; keys identify participants, e.g. id_in_subsession.
+            Arrival times must not decrease along the order (see expire()).
+    """
+
+    def __init__(self):
+        self.arrivals = OrderedDict()
+
+    def arrive(self, key, now=None):
+        """Add a participant; a participant who is already waiting keeps their place and arrival time."""
+        if key not in self.arrivals:
+            self.arrivals[key] = time.time() if now is None else now
+
+    def leave(self, key):
+        """Remove a participant (grouped, timed out or gone); returns the arrival time or None."""
+        return self.arrivals.pop(key, None)
+
+    def take(self, size, present=None):
+        """
+        Remove and return the keys of the first size participants, or None if fewer are waiting.
+
+        Args:
+            size: Group size
+            present: Optional container of keys that can be grouped now (e.g. connected participants); others keep
+                their place
+        """
+        keys = []
+        for key in self.arrivals:
+            if present is None or key in present:
+                keys.append(key)
+                if len(keys) == size:
+                    for k in keys:
+                        del self.arrivals[k]
+                    return keys
+        return None
+
+    def deadline(self, key, timeout):
+        """Return the time at which a participant's waiting time runs out, or None if they are not waiting."""
+        arrival = self.arrivals.get(key)
+        return None if arrival is None else arrival + timeout
+
+    def next_deadline(self, timeout):
+        """Return the earliest deadline of all waiting participants, or None if nobody waits."""
+        for arrival in self.arrivals.values():
+            return arrival + timeout
+        return None
+
+    def expire(self, now, timeout):
+        """Remove and return the keys of all participants whose waiting time ran out, in order of arrival."""
+        keys = []
+        for key, arrival in self.arrivals.items():
+            if now < arrival + timeout:
+                break
+            keys.append(key)
+        for key in keys:
+            del self.arrivals[key]
+        return keys
+
+    def needed(self, size):
+        """Return how many more participants the next group needs."""
+        return size - len(self.arrivals) % size
+
+    def __len__(self):
+        return len(self.arrivals)
+
+    def __contains__(self, key):
+        return key in self.arrivals
+
+    def __iter__(self):
+        return iter(self.arrivals)
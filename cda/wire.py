@@ -0,0 +1,136 @@
+"""Compact encoding of the updates of the market page.
+
+The updates of the live_method() are dicts with repeated key names and prices, times and holdings as floats or
+formatted strings. Clients that announce ``'encoding': 'compact'`` receive each update as a positional array instead:
+
+    [VERSION, seq, mask, value, value, ...]
+
+Bit i of ``mask`` is set if the update contains the i-th field of ``FIELDS``; only these fields follow, in the order
+of ``FIELDS``, such that absent fields cost nothing. Prices, times, cash and utilities are sent as integer ticks, i.e.
+multiplied by ``ticks`` (10 ** decimals) and rounded; a snapshot carries the tick size for the following deltas.
+Within the fields, rows are positional as well:
+
+- bids, asks: [price, volume, offerID, makerID]
+- book: [0, isBid, price, volume, offerID, makerID] (add), [1, offerID] (remove), [2, offerID, remainingVolume] (update)
+- trades: [price, volume, time, sellerID]
+- chart: flat list [time, price, time, price, ...]
+- news: [msg, msgTime]; news only go to the participant they concern, so the playerID is left out
+- goods_trade: [good, quantity, price]
+
+``decode()`` restores the dict of an update and mirrors the decoder of the market page (scriptMarket.js).
+"""
+VERSION = 1
+
+FIELDS = [
+    'snapshot', 'ticks', 'chart_max_points', 'bids', 'asks', 'book', 'trades', 'chart', 'news',
+    'cashHolding', 'assetsHolding', 'goodA_qty', 'goodB_qty', 'goods_utility', 'overall_utility', 'goods_trade',
+]
+TICK_FIELDS = {'cashHolding', 'goods_utility', 'overall_utility'}
+BOOK_OPS = ['add', 'remove', 'update']
+
+
+def to_ticks(value, ticks):
+    return int(round(float(value) * ticks))
+
+
+def encode_offer(row, ticks):
+    return [to_ticks(row[0], ticks), row[1], row[2], row[3]]
+
+
+def encode_trade(row, ticks):
+    return [to_ticks(row[0], ticks), row[1], to_ticks(row[2], ticks), row[3]]
+
+
+def encode_change(change, ticks):
+    if change[0] == 'add':
+        return [0, int(change[1])] + encode_offer(change[2], ticks)
+    return [BOOK_OPS.index(change[0])] + list(change[1:])
+
+
+def encode(update, ticks):
+    """
+    Encode the dict of a snapshot or delta as positional array.
+
+    Args:
+        update: Dict as returned by full_update() or delta_update() of the Trading app, with its 'seq'
+        ticks: Ticks per currency unit and second, e.g. 100 for two decimals
+
+    Returns:
+        list: [VERSION, seq, mask, values of the present fields]
+    """
+    values = dict()
+    if update.get('snapshot'):
+        values.update(snapshot=1, ticks=ticks, chart_max_points=update.get('chart_max_points'))
+        points = [(d['x'], d['y']) for s in update.get('highcharts_series', []) for d in s['data']]
+    else:
+        points = [(d['x'], d['y']) for d in update.get('chart', [])]
+    for side in ('bids', 'asks'):
+        if side in update:
+            values[side] = [encode_offer(row, ticks) for row in update[side]]
+    if update.get('book'):
+        values['book'] = [encode_change(change, ticks) for change in update['book']]
+    if update.get('trades'):
+        values['trades'] = [encode_trade(row, ticks) for row in update['trades']]
+    if points:
+        values['chart'] = [to_ticks(v, ticks) for point in points for v in point]
+    if update.get('news'):
+        values['news'] = [[n[0], to_ticks(n[1], ticks)] for n in update['news']]
+    for field in ('cashHolding', 'assetsHolding', 'goodA_qty', 'goodB_qty', 'goods_utility', 'overall_utility'):
+        if update.get(field) is not None:
+            values[field] = to_ticks(update[field], ticks) if field in TICK_FIELDS else update[field]
+    if update.get('goods_trade_good'):
+        values['goods_trade'] = [update['goods_trade_good'], update['goods_trade_qty'],
+                                 to_ticks(update['goods_trade_price'] or 0, ticks)]
+    mask = 0
+    message = [VERSION, update.get('seq'), 0]
+    for i, field in enumerate(FIELDS):
+        if field in values and values[field] is not None:
+            mask |= 1 << i
+            message.append(values[field])
+    message[2] = mask
+    return message
+
+
+def decode(message, ticks=None):
+    """
+    Restore the dict of an update from its positional array.
+
+    Args:
+        message: List as returned by encode()
+        ticks: Tick size of the last snapshot; a snapshot carries its own
+
+    Returns:
+        dict: The update, or None if the message has another VERSION
+    """
+    if not message or message[0] != VERSION:
+        return None
+    values, present = dict(), iter(message[3:])
+    for i, field in enumerate(FIELDS):
+        if message[2] & (1 << i):
+            values[field] = next(present)
+    ticks = values.get('ticks', ticks)
+    update = dict(seq=message[1])
+    for side in ('bids', 'asks'):
+        if side in values:
+            update[side] = [[row[0] / ticks] + row[1:] for row in values[side]]
+    if 'book' in values:
+        update['book'] = [['add', bool(c[1]), [c[2] / ticks] + c[3:]] if c[0] == 0 else [BOOK_OPS[c[0]]] + c[1:]
+                          for c in values['book']]
+    if 'trades' in values:
+        update['trades'] = [[row[0] / ticks, row[1], row[2] / ticks, row[3]] for row in values['trades']]
+    flat = values.get('chart', [])
+    points = [{'x': flat[i] / ticks, 'y': flat[i + 1] / ticks, 'name': 'Trades'} for i in range(0, len(flat), 2)]
+    if values.get('snapshot'):
+        update.update(snapshot=True, chart_max_points=values.get('chart_max_points'), news=[], trades=update.get('trades', []),
+                      highcharts_series=[{'name': 'Trades', 'data': points}] if points else [])
+    elif points:
+        update['chart'] = points
+    if 'news' in values:
+        update['news'] = [[n[0], n[1] / ticks, None] for n in values['news']]
+    for field in ('cashHolding', 'assetsHolding', 'goodA_qty', 'goodB_qty', 'goods_utility', 'overall_utility'):
+        if field in values:
+            update[field] = values[field] / ticks if field in TICK_FIELDS else values[field]
+    if 'goods_trade' in values:
+        good, qty, price = values['goods_trade']
+        update.update(goods_trade_good=good, goods_trade_qty=qty, goods_trade_price=price / ticks)
+    return update
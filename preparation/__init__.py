@@ -2,8 +2,8 @@
 
 from otree.api import *
 from otree.api import widgets
-import time
 from os import environ
+from cda.deadlines import persistent_timeout
 
 doc = """Preparation app: Welcome, Privacy, Instructions, and Comprehension Check"""
 
@@ -46,28 +46,6 @@ class Group(BaseGroup):
     pass
 
 
-def persistent_timeout(player: 'Player', page_name: str, default_seconds: float) -> float:
-    """
-    Create a server-side deadline the first time the player reaches a page in a given round.
-    Subsequent visits (via browser back button, refresh, etc.) use the same deadline so the
-    remaining time can only decrease.
-    """
-    key = f'timeout_deadline_{page_name}_round_{player.round_number}'
-    deadlines = player.participant.vars.setdefault('page_deadlines', {})
-    now = time.time()
-    deadline = deadlines.get(key)
-
-    if deadline is None:
-        deadline = now + default_seconds
-        deadlines[key] = deadline
-
-    remaining = deadline - now
-
-    if remaining < 0:
-        return 0
-    return remaining
-
-
 class Player(BasePlayer):
     # Minimal fields needed for preparation pages
     isParticipating = models.BooleanField(choices=((True, 'active'), (False, 'inactive')), initial=0)
@@ -0,0 +1,37 @@
+from otree.api import Bot, Submission
+from . import Welcome, Privacy, ProlificID, Instructions, ComprehensionCheck, ComprehensionPassed
+
+
+class PlayerBot(Bot):
+    def play_round(self):
+        # Welcome page - just click next
+        yield Submission(Welcome, check_html=False)
+
+        # Privacy page - consent
+        yield Submission(Privacy, {'consent': True}, check_html=False)
+
+        # ProlificID - only shown when the ID was not passed as participant label
+        if not self.participant.label:
+            yield Submission(ProlificID, {'prolific_id': f'BOT{self.participant.code}'.upper().ljust(24, '0')[:24]}, check_html=False)
+
+        # Instructions page - just click next
+        yield Submission(Instructions, check_html=False)
+
+        # ComprehensionCheck - answer all questions correctly
+        comp_answers = {
+            'comp_q1': 'c',  # Total Score increases from 50 to 65
+            'comp_q2': 'a',  # Total Score decreases from 40 to 30
+            'comp_q3': 'c',  # They do not directly affect Total Score, but needed to buy goods
+            'comp_q4': 'b',  # Incorrect (they are transferred)
+            'comp_q5': 'c'   # All get the base payment, highest in group gets bonus
+        }
+
+        # Add comp_q6 for destruction group
+        if self.player.framing == 'destruction':
+            comp_answers['comp_q6'] = 'a'  # Correct - CO2 compensation
+
+        # Submit comprehension check with correct answers (should pass on first try)
+        yield Submission(ComprehensionCheck, comp_answers, check_html=False)
+
+        # After passing, ComprehensionPassed page is shown
+        yield Submission(ComprehensionPassed, check_html=False)